@@ -0,0 +1,260 @@
+import os
+import bpy
+import numpy as np
+from mathutils import Vector
+from bpy_extras.object_utils import world_to_camera_view
+from utils import atomic_write
+
+'''
+Frame level fire annotations recorded while the frames render: every rendered frame gets the pixel
+bounding box of every fire domain and burning tree, and optionally an object index mask image.
+the boxes are saved as columns of one compressed .npz file, one row per frame and object.
+'''
+
+# class ids of the annotated objects, 0 is the background of the masks
+annotation_classes: dict[str, int] = {"fire": 1, "burning_tree": 2}
+
+def annotated_objects(scene: bpy.types.Scene) -> list[tuple[bpy.types.Object, int]]:
+    '''
+    Finds the objects to annotate: the fire domains and the trees set on fire as their flows.
+
+    Parameters:
+    - scene: The scene to search.
+
+    Returns:
+    - The objects and their class ids, sorted by name.
+    '''
+    objects = []
+    for obj in scene.objects:
+        fluid = obj.modifiers.get("Fluid")
+        if fluid is None:
+            continue
+        if fluid.fluid_type == 'DOMAIN':
+            objects.append((obj, annotation_classes["fire"]))
+        elif fluid.fluid_type == 'FLOW':
+            objects.append((obj, annotation_classes["burning_tree"]))
+
+    return sorted(objects, key=lambda item: item[0].name)
+
+def render_size(scene: bpy.types.Scene) -> tuple[int, int]:
+    '''
+    Returns the size of the rendered frames in pixels, with the resolution percentage applied.
+    '''
+    scale = scene.render.resolution_percentage / 100
+
+    return int(scene.render.resolution_x * scale), int(scene.render.resolution_y * scale)
+
+def project_bounding_box(scene: bpy.types.Scene, camera: bpy.types.Object, obj: bpy.types.Object,
+                         size: tuple[int, int]) -> tuple[np.ndarray, bool, bool]:
+    '''
+    Projects the bounding box of an object through the camera.
+    corners behind the camera are left out, such boxes are marked truncated.
+
+    Parameters:
+    - scene: The scene, its resolution gives the aspect ratio of the camera.
+    - camera: The camera, evaluated at the frame.
+    - obj: The object, evaluated at the frame.
+    - size: The size of the frame in pixels.
+
+    Returns:
+    - The box as x min, y min, x max, y max in pixels from the top left corner of the frame,
+      whether any of it is on screen, and whether it is cut by the frame border or the camera plane.
+    '''
+    corners = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]
+    projected = np.array([tuple(world_to_camera_view(scene, camera, corner)) for corner in corners])
+
+    front = projected[:, 2] > 0
+    if not front.any():
+        return np.zeros(4, dtype=np.float32), False, True
+
+    # image rows grow downwards, camera view y grows upwards
+    xs = projected[front, 0] * size[0]
+    ys = (1 - projected[front, 1]) * size[1]
+    box = np.array([xs.min(), ys.min(), xs.max(), ys.max()])
+    clipped = np.clip(box, 0, [size[0], size[1], size[0], size[1]])
+
+    visible = bool(clipped[2] > clipped[0] and clipped[3] > clipped[1])
+    truncated = bool(not front.all() or (clipped != box).any())
+
+    return clipped.astype(np.float32), visible, truncated
+
+def enable_index_masks(scene: bpy.types.Scene, objects: list[bpy.types.Object], masks_dir: str):
+    '''
+    Writes an object index mask next to every rendered frame: the object index pass is routed to a
+    file output node of the compositor, and every annotated object gets its row in objects plus one as index.
+    the masks are 16 bit EXR images, so the indices are exact. the fire volume itself writes no
+    object index, its pixels are only covered by the boxes. not available in workbench.
+
+    Parameters:
+    - scene: The scene to render.
+    - objects: The annotated objects, in the order of the annotation object names.
+    - masks_dir: The directory to write the masks to, as mask_<frame>.exr.
+
+    Returns:
+    - None
+    '''
+    for index, obj in enumerate(objects):
+        obj.pass_index = index + 1
+    bpy.context.view_layer.use_pass_object_index = True
+
+    scene.use_nodes = True
+    nodes = scene.node_tree.nodes
+    links = scene.node_tree.links
+    nodes.clear()
+
+    render_layers = nodes.new('CompositorNodeRLayers')
+    composite = nodes.new('CompositorNodeComposite')
+    links.new(render_layers.outputs["Image"], composite.inputs["Image"])
+
+    mask_output = nodes.new('CompositorNodeOutputFile')
+    mask_output.base_path = masks_dir
+    mask_output.format.file_format = 'OPEN_EXR'
+    mask_output.format.color_mode = 'BW'
+    mask_output.format.color_depth = '16'
+    mask_output.format.exr_codec = 'ZIP'
+    mask_output.file_slots[0].path = "mask_"
+    links.new(render_layers.outputs["IndexOB"], mask_output.inputs[0])
+
+class AnnotationRecorder:
+    '''
+    Records the bounding boxes of the annotated objects at every frame the scene changes to while rendering,
+    from a frame change handler, so the labels come out of the render loop without a second pass.
+    '''
+
+    def __init__(self, scene: bpy.types.Scene, masks_dir: str = None):
+        '''
+        Parameters:
+        - scene: The scene to render, its camera is projected through.
+        - masks_dir: The directory to write object index masks to, None writes no masks.
+        '''
+        self.scene = scene
+        self.masks_dir = masks_dir
+        self.objects = annotated_objects(scene)
+        self.rows: dict[int, list[tuple]] = {}
+
+    def start(self):
+        '''
+        Registers the frame change handler and the mask output.
+        '''
+        if self.masks_dir is not None:
+            os.makedirs(self.masks_dir, exist_ok=True)
+            enable_index_masks(self.scene, [obj for obj, _ in self.objects], self.masks_dir)
+        bpy.app.handlers.frame_change_post.append(self.record)
+
+    def stop(self):
+        '''
+        Unregisters the frame change handler.
+        '''
+        if self.record in bpy.app.handlers.frame_change_post:
+            bpy.app.handlers.frame_change_post.remove(self.record)
+
+    def record(self, scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph = None):
+        '''
+        Projects the annotated objects at the current frame, a frame seen twice keeps its last rows.
+
+        Parameters:
+        - scene: The scene whose frame changed.
+        - depsgraph: The evaluated dependency graph of the frame.
+        '''
+        if scene != self.scene:
+            return
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+
+        size = render_size(scene)
+        camera = scene.camera.evaluated_get(depsgraph)
+        rows = []
+        for index, (obj, class_id) in enumerate(self.objects):
+            box, visible, truncated = project_bounding_box(scene, camera, obj.evaluated_get(depsgraph), size)
+            rows.append((index, class_id, box, visible, truncated))
+        self.rows[scene.frame_current] = rows
+
+    def columns(self) -> dict[str, np.ndarray]:
+        '''
+        Returns the recorded rows as columns, sorted by frame.
+        '''
+        frames = sorted(self.rows)
+        rows = [(frame, *row) for frame in frames for row in self.rows[frame]]
+
+        return {
+            "frame": np.array([row[0] for row in rows], dtype=np.int32),
+            "object": np.array([row[1] for row in rows], dtype=np.int32),
+            "class_id": np.array([row[2] for row in rows], dtype=np.uint8),
+            "box": np.array([row[3] for row in rows], dtype=np.float32).reshape(-1, 4),
+            "visible": np.array([row[4] for row in rows], dtype=bool),
+            "truncated": np.array([row[5] for row in rows], dtype=bool),
+            "object_names": np.array([obj.name for obj, _ in self.objects], dtype=str),
+            "class_names": np.array(list(annotation_classes), dtype=str),
+            "resolution": np.array(render_size(self.scene), dtype=np.int32),
+        }
+
+    def save(self, path: str):
+        '''
+        Saves the recorded annotations to a compressed .npz file, written under a temporary name and renamed.
+
+        Parameters:
+        - path: The annotation file.
+        '''
+        save_annotations(path, self.columns())
+
+def save_annotations(path: str, columns: dict[str, np.ndarray]):
+    '''
+    Saves annotation columns to a compressed .npz file, written under a temporary name and renamed.
+
+    Parameters:
+    - path: The annotation file.
+    - columns: The annotation columns.
+
+    Returns:
+    - None
+    '''
+    # through a file object, a file name would get .npz appended
+    def write(part_path: str):
+        with open(part_path, "wb") as file:
+            np.savez_compressed(file, **columns)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write(path, write)
+
+def merge_annotations(paths: list[str], output_path: str):
+    '''
+    Merges the annotation files of several render processes into one, sorted by frame.
+    object indices are remapped to the merged object names, a frame in several files keeps its last rows.
+
+    Parameters:
+    - paths: The annotation files to merge.
+    - output_path: The merged annotation file.
+
+    Returns:
+    - None
+    '''
+    parts = []
+    for path in paths:
+        with np.load(path) as data:
+            parts.append({name: data[name] for name in data.files})
+    if not parts:
+        return
+
+    object_names = sorted({str(name) for part in parts for name in part["object_names"]})
+    name_index = {name: index for index, name in enumerate(object_names)}
+
+    rows_by_frame = {}
+    for part in parts:
+        remap = np.array([name_index[str(name)] for name in part["object_names"]], dtype=np.int32)
+        for frame in np.unique(part["frame"]):
+            rows = part["frame"] == frame
+            rows_by_frame[int(frame)] = (part, rows, remap)
+
+    columns = {name: [] for name in ("frame", "object", "class_id", "box", "visible", "truncated")}
+    for frame in sorted(rows_by_frame):
+        part, rows, remap = rows_by_frame[frame]
+        columns["frame"].append(part["frame"][rows])
+        columns["object"].append(remap[part["object"][rows]])
+        for name in ("class_id", "box", "visible", "truncated"):
+            columns[name].append(part[name][rows])
+
+    merged = {name: np.concatenate(values) for name, values in columns.items()}
+    merged["object_names"] = np.array(object_names, dtype=str)
+    merged["class_names"] = parts[0]["class_names"]
+    merged["resolution"] = parts[0]["resolution"]
+    save_annotations(output_path, merged)
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import bpy
+from terrain import generate_noise, generate_terrain, array_to_mesh
+from vegetation import generate_trees
+from seeding import stage_rng
+from utils import reset_scene, save_scene_to_file, peak_rss_mb
+from forrestGeneration import build_parser, generate_scene
+from videoGeneration import get_video
+
+'''
+Headless benchmark suite for terrain, vegetation, scene saving and rendering throughput.
+every case runs several times from a reset scene and keeps the best and median wall times,
+the results go to a JSON file so runs on different commits can be compared with --compare.
+'''
+
+def measure(name: str, params: dict, func, repeat: int, setup=None) -> dict:
+    '''
+    Times a benchmark case.
+
+    Parameters:
+    - name: The name of the case.
+    - params: The parameters of the case, stored with the result.
+    - func: The code to time, called without arguments.
+    - repeat: The number of timed runs.
+    - setup: Untimed code to run before every run, called without arguments, the scene is reset before it.
+
+    Returns:
+    - The result of the case.
+    '''
+    seconds = []
+    for _ in range(repeat):
+        reset_scene()
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+
+    seconds.sort()
+    result = {"name": name, "params": params, "best_seconds": seconds[0],
+              "median_seconds": seconds[len(seconds) // 2], "peak_rss_mb": peak_rss_mb()}
+    print(f"{name:<16}{json.dumps(params):<60}{seconds[0]:>10.3f}s")
+
+    return result
+
+def terrain_cases(sizes: list[int], repeat: int) -> list[dict]:
+    '''
+    Benchmarks noise, terrain and terrain mesh generation at several grid sizes.
+    '''
+    results = []
+    for size in sizes:
+        params = {"xpix": size, "ypix": size}
+        results.append(measure("generate_noise", {**params, "octave": 24},
+                               lambda: generate_noise(size, size, 24, 1), repeat))
+        results.append(measure("generate_terrain", params,
+                               lambda: generate_terrain(size, size, 5.0, 0.5, 1), repeat))
+        terrain = generate_terrain(size, size, 5.0, 0.5, 1)
+        results.append(measure("array_to_mesh", params, lambda: array_to_mesh(terrain), repeat))
+
+    return results
+
+def vegetation_cases(counts: list[int], repeat: int) -> list[dict]:
+    '''
+    Benchmarks tree generation at several tree counts, as objects and as a geometry nodes scatter.
+    '''
+    terrain = generate_terrain(100, 100, 5.0, 0.5, 1)
+    state = {}
+
+    def setup():
+        state["mesh"] = array_to_mesh(terrain)
+
+    results = []
+    for count in counts:
+        for mode in ("objects", "scatter"):
+            results.append(measure("generate_trees", {"count": count, "mode": mode},
+                                   lambda: generate_trees(count, 100, 100, state["mesh"], mode, terrain,
+                                                                  rng=stage_rng(1, "trees")),
+                                   repeat, setup))
+
+    return results
+
+def scene_args(output_path: str, path_duration: int):
+    '''
+    Returns the default scene parameters of forrestGeneration.py with another output path and duration.
+    '''
+    args = build_parser().parse_args([])
+    args.output_path = output_path
+    args.path_duration = path_duration
+
+    return args
+
+def save_cases(output_dir: str, repeat: int) -> list[dict]:
+    '''
+    Benchmarks saving the default scene, plain, compressed and with the shared data in a base library.
+    '''
+    file_path = os.path.join(output_dir, "scene.blend")
+    base_library = os.path.join(output_dir, "base")
+
+    results = []
+    for compress, delta in ((False, False), (True, False), (True, True)):
+        params = {"compress": compress, "base_library": delta}
+        result = measure("save_scene", params,
+                         lambda: save_scene_to_file(file_path, compress, base_library=base_library if delta else None),
+                         repeat, lambda: generate_scene(scene_args(file_path, 200)))
+        result["file_mb"] = os.path.getsize(file_path) / 1024**2
+        results.append(result)
+
+    return results
+
+def render_cases(output_dir: str, resolutions: list[int], profiles: list[str], frames: int,
+                 device: str, repeat: int) -> list[dict]:
+    '''
+    Benchmarks a short render of the default scene at several resolutions and render profiles.
+    '''
+    file_path = os.path.join(output_dir, "scene.blend")
+    video_path = os.path.join(output_dir, "video.mp4")
+
+    results = []
+    for resolution in resolutions:
+        for profile in profiles:
+            params = {"resolution": resolution, "profile": profile, "frames": frames, "device": device}
+            result = measure("get_video", params,
+                             lambda: get_video(video_path, bpy.data.objects["camera"], frames,
+                                               (resolution, resolution), 30.0, profile, device),
+                             repeat, lambda: generate_scene(scene_args(file_path, frames)))
+            result["seconds_per_frame"] = result["best_seconds"] / frames
+            results.append(result)
+
+    return results
+
+def git_commit() -> str:
+    '''
+    Returns the current git commit of the repository, or "unknown".
+    '''
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(old_path: str, new_path: str):
+    '''
+    Prints the speedup of every case of a new result file relative to an old one.
+
+    Parameters:
+    - old_path: The baseline result file.
+    - new_path: The result file to compare.
+
+    Returns:
+    - None
+    '''
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+
+    baseline = {(result["name"], json.dumps(result["params"], sort_keys=True)): result for result in old["results"]}
+    for result in new["results"]:
+        key = (result["name"], json.dumps(result["params"], sort_keys=True))
+        if key not in baseline:
+            continue
+        speedup = baseline[key]["best_seconds"] / result["best_seconds"]
+        print(f"{result['name']:<16}{key[1]:<60}{speedup:>8.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark scene generation and rendering.")
+    parser.add_argument("--suites", type=str, nargs="+", default=["terrain", "vegetation", "save", "render"],
+                        choices=["terrain", "vegetation", "save", "render"], help="Benchmark suites to run")
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=[100, 250, 500, 1000],
+                        help="Terrain grid sizes")
+    parser.add_argument("--tree-counts", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Tree counts")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[144, 288],
+                        help="Square render resolutions")
+    parser.add_argument("--profiles", type=str, nargs="+", default=["draft", "dataset"],
+                        help="Render profiles")
+    parser.add_argument("--frames", type=int, default=3, help="Frames per render case")
+    parser.add_argument("--device", type=str, default="CPU", choices=["CPU", "GPU"], help="Cycles render device")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Result file, defaults to bench/results-<commit>.json")
+    parser.add_argument("--compare", type=str, nargs=2, default=None, metavar=("OLD", "NEW"),
+                        help="Compare two result files instead of running the benchmarks")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        compare(*args.compare)
+        sys.exit()
+
+    commit = git_commit()
+    output = args.output or os.path.join("bench", f"results-{commit}.json")
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        if "terrain" in args.suites:
+            results += terrain_cases(args.grid_sizes, args.repeat)
+        if "vegetation" in args.suites:
+            results += vegetation_cases(args.tree_counts, args.repeat)
+        if "save" in args.suites:
+            results += save_cases(output_dir, args.repeat)
+        if "render" in args.suites:
+            results += render_cases(output_dir, args.resolutions, args.profiles, args.frames, args.device, args.repeat)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump({
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "blender": bpy.app.version_string,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }, output_file, indent=2)
+    print(f"results saved to {output}")
@@ -1,5 +1,5 @@
 import bpy
-import math
+import numpy as np
 
 def add_camera(location: tuple[float, float, float], rotation: tuple[float, float, float]) -> bpy.types.Object:
     '''
@@ -75,33 +75,88 @@ def look_at_curve(camera: bpy.types.Object, curve: bpy.types.Curve, path_duratio
 
     return camera
 
-def get_video(file_path: str, camera: bpy.types.Object, path_duration: int, resolution: tuple[int, int], fov: float):
+def track_to_rotations(locations: np.ndarray, targets: np.ndarray) -> np.ndarray:
     '''
-    Renders a video using the specified camera and path duration.
-    Uses GPU acceleration with cycles rendering for optimal performance.
+    Computes the rotations that point cameras at targets, like a TRACK_TO constraint with
+    track axis -Z and up axis Y, all at once.
 
     Parameters:
-    - file_path: The path where the rendered video will be saved.
-    - camera: The camera object used for rendering the video.
-    - path_duration: The duration of the video in frames.
-    - resolution: The resolution of the video in pixels.
-    - fov: The field of view of the camera in degrees.
+    - locations: (F, 3) array of camera locations.
+    - targets: (F, 3) array of the points the camera looks at.
 
     Returns:
-    - None
+    - (F, 3, 3) array of rotation matrices, whose columns are the camera x, y and z axes in world space.
     '''
-    bpy.context.scene.camera = camera
-    bpy.context.scene.frame_end = path_duration
-    bpy.context.scene.render.image_settings.file_format = 'FFMPEG'
-    bpy.context.scene.render.ffmpeg.format = 'MPEG4'
-    bpy.context.scene.render.filepath = file_path
+    z_axis = np.asarray(locations, dtype=float) - targets
+    z_axis /= np.linalg.norm(z_axis, axis=1, keepdims=True)
 
-    # use GPU acceleration with cycles rendering for optimal performance
-    bpy.context.scene.render.engine = 'CYCLES'
-    bpy.context.scene.cycles.device = 'GPU'
+    # looking straight down or up leaves the roll undefined, fall back to the world y axis
+    x_axis = np.cross([0.0, 0.0, 1.0], z_axis)
+    degenerate = np.linalg.norm(x_axis, axis=1) < 1e-9
+    x_axis[degenerate] = np.cross([0.0, 1.0, 0.0], z_axis[degenerate])
+    x_axis /= np.linalg.norm(x_axis, axis=1, keepdims=True)
+    y_axis = np.cross(z_axis, x_axis)
 
-    bpy.context.scene.render.resolution_x = resolution[0]
-    bpy.context.scene.render.resolution_y = resolution[1]
-    bpy.context.scene.camera.data.angle = math.radians(fov)
+    return np.stack((x_axis, y_axis, z_axis), axis=2)
 
-    bpy.ops.render.render(animation=True)
+def rotations_to_euler(rotations: np.ndarray) -> np.ndarray:
+    '''
+    Converts rotation matrices to XYZ Euler angles, unwrapped along the first axis
+    so interpolating between consecutive keyframes never spins the long way around.
+
+    Parameters:
+    - rotations: (F, 3, 3) array of rotation matrices.
+
+    Returns:
+    - (F, 3) array of Euler angles in radians.
+    '''
+    x = np.arctan2(rotations[:, 2, 1], rotations[:, 2, 2])
+    y = np.arcsin(np.clip(-rotations[:, 2, 0], -1, 1))
+    z = np.arctan2(rotations[:, 1, 0], rotations[:, 0, 0])
+
+    return np.unwrap(np.column_stack((x, y, z)), axis=0)
+
+def bake_camera_path(camera: bpy.types.Object, locations: np.ndarray, targets: np.ndarray,
+                     frame_start: int = 1) -> np.ndarray:
+    '''
+    Animates a camera from precomputed arrays, one keyframe per frame, in place of the
+    FOLLOW_PATH and TRACK_TO constraints, which Blender would re-evaluate at every frame.
+    the keyframes are written with foreach_set, and the locations and rotations are kept
+    as custom properties of the camera, so culling can read them without stepping the frames.
+
+    Parameters:
+    - camera: The camera object, its constraints are removed.
+    - locations: (F, 3) array of camera locations.
+    - targets: (F, 3) array of the points the camera looks at.
+    - frame_start: The frame of the first sample.
+
+    Returns:
+    - (F, 3, 3) array of the camera rotation matrices.
+    '''
+    for constraint in list(camera.constraints):
+        camera.constraints.remove(constraint)
+
+    locations = np.asarray(locations, dtype=float)
+    rotations = track_to_rotations(locations, targets)
+    eulers = rotations_to_euler(rotations)
+    frames = np.arange(frame_start, frame_start + len(locations), dtype=float)
+
+    camera.rotation_mode = 'XYZ'
+    camera.location = locations[0]
+    camera.rotation_euler = eulers[0]
+    camera.animation_data_create()
+    action = bpy.data.actions.new(f"{camera.name}Path")
+    camera.animation_data.action = action
+
+    for data_path, values in (("location", locations), ("rotation_euler", eulers)):
+        for index in range(3):
+            fcurve = action.fcurves.new(data_path, index=index)
+            fcurve.keyframe_points.add(len(frames))
+            fcurve.keyframe_points.foreach_set("co", np.column_stack((frames, values[:, index])).ravel())
+            fcurve.update()
+
+    camera["path_frames"] = frames.astype(int).tolist()
+    camera["path_locations"] = locations.ravel().tolist()
+    camera["path_rotations"] = rotations.ravel().tolist()
+
+    return rotations
@@ -0,0 +1,115 @@
+import math
+import bpy
+import numpy as np
+
+'''
+Frustum culling of scene objects against the animated render camera: the camera is sampled along its path
+once, and all object positions are tested against every sampled view at once with NumPy.
+'''
+
+def camera_views(camera: bpy.types.Object, frames: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Samples the world placement of an animated camera at the given frames.
+    a camera animated by camera.bake_camera_path is read from its baked arrays without stepping the frames.
+
+    Parameters:
+    - camera: The camera object.
+    - frames: The frames to sample.
+
+    Returns:
+    - (F, 3) array of camera locations and (F, 3, 3) array of camera rotation matrices,
+      whose columns are the camera x, y and z axes in world space.
+    '''
+    if "path_frames" in camera:
+        baked_frames = np.array(camera["path_frames"])
+        rows = np.clip(np.searchsorted(baked_frames, frames), 0, len(baked_frames) - 1)
+        locations = np.array(camera["path_locations"]).reshape(-1, 3)
+        rotations = np.array(camera["path_rotations"]).reshape(-1, 3, 3)
+        return locations[rows], rotations[rows]
+
+    scene = bpy.context.scene
+    current_frame = scene.frame_current
+
+    locations = np.empty((len(frames), 3))
+    rotations = np.empty((len(frames), 3, 3))
+    for index, frame in enumerate(frames):
+        scene.frame_set(frame)
+        matrix = np.array(camera.matrix_world)
+        locations[index] = matrix[:3, 3]
+        rotations[index] = matrix[:3, :3] / np.linalg.norm(matrix[:3, :3], axis=0)
+
+    scene.frame_set(current_frame)
+
+    return locations, rotations
+
+def frustum_tangents(camera: bpy.types.Object, resolution: tuple[int, int]) -> tuple[float, float]:
+    '''
+    Returns the tangents of the horizontal and vertical half angles of view of a camera,
+    the camera angle spans the longer side of the frame as with the automatic sensor fit.
+
+    Parameters:
+    - camera: The camera object.
+    - resolution: The render resolution in pixels.
+
+    Returns:
+    - The horizontal and vertical half angle tangents.
+    '''
+    tangent = math.tan(camera.data.angle / 2)
+    longest = max(resolution)
+
+    return tangent * resolution[0] / longest, tangent * resolution[1] / longest
+
+def frustum_mask(positions: np.ndarray, locations: np.ndarray, rotations: np.ndarray, tan_x: float, tan_y: float,
+                 radius: float | np.ndarray = 0.0, clip_start: float = 0.1, clip_end: float = 1000.0) -> np.ndarray:
+    '''
+    Tests which spheres are inside the camera frustum at any of the sampled views.
+
+    Parameters:
+    - positions: (N, 3) array of sphere centers.
+    - locations: (F, 3) array of camera locations.
+    - rotations: (F, 3, 3) array of camera rotation matrices, see camera_views.
+    - tan_x: The tangent of the horizontal half angle of view.
+    - tan_y: The tangent of the vertical half angle of view.
+    - radius: The radius of the spheres, e.g. the size of the objects plus a margin for the motion between views,
+      one radius for all spheres or an array of length N.
+    - clip_start: The near clipping distance of the camera.
+    - clip_end: The far clipping distance of the camera.
+
+    Returns:
+    - Boolean array of length N, True where the sphere is seen in at least one view.
+    '''
+    positions = np.asarray(positions, dtype=float)
+    visible = np.zeros(len(positions), dtype=bool)
+
+    # a sphere is outside a side plane when its center is further than radius outside it
+    side_x = radius * math.sqrt(1 + tan_x**2)
+    side_y = radius * math.sqrt(1 + tan_y**2)
+    for location, rotation in zip(locations, rotations):
+        local = (positions - location) @ rotation
+        depth = -local[:, 2]
+        visible |= ((depth > clip_start - radius) & (depth < clip_end + radius)
+                    & (np.abs(local[:, 0]) - tan_x * depth <= side_x)
+                    & (np.abs(local[:, 1]) - tan_y * depth <= side_y))
+
+    return visible
+
+def visible_mask(positions: np.ndarray, camera: bpy.types.Object, frames: list[int], resolution: tuple[int, int],
+                 radius: float | np.ndarray = 0.0) -> np.ndarray:
+    '''
+    Tests which positions the animated camera sees at any of the given frames.
+
+    Parameters:
+    - positions: (N, 3) array of positions.
+    - camera: The animated camera object.
+    - frames: The frames to sample the camera path at.
+    - resolution: The render resolution in pixels.
+    - radius: The radius around every position that has to be outside the frustum to cull it, or an array of length N.
+
+    Returns:
+    - Boolean array of length N, True where the position is seen.
+    '''
+    locations, rotations = camera_views(camera, frames)
+    tan_x, tan_y = frustum_tangents(camera, resolution)
+
+    return frustum_mask(positions, locations, rotations, tan_x, tan_y, radius,
+                        camera.data.clip_start, camera.data.clip_end)
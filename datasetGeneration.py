@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+import traceback
+import multiprocessing
+
+'''
+Batch dataset generation: builds many scenes in parallel, each worker process imports bpy once
+and builds one scene per task, every scene gets a unique file and a manifest record with its parameters.
+'''
+
+def parse_seed_range(seeds: str) -> list[int]:
+    '''
+    Parses a seed range of the form "start:stop" (stop excluded) or a comma separated list of seeds.
+
+    Parameters:
+    - seeds: The seed range.
+
+    Returns:
+    - The list of seeds.
+    '''
+    if ":" in seeds:
+        start, stop = seeds.split(":")
+        return list(range(int(start), int(stop)))
+
+    return [int(seed) for seed in seeds.split(",")]
+
+def expand_sweep(sweep: dict[str, list], seeds: list[int]) -> list[dict]:
+    '''
+    Expands a parameter sweep into one parameter override dict per scene.
+    every combination of the swept values is generated once for every seed.
+
+    Parameters:
+    - sweep: Maps scene parameter names (as in forrestGeneration.build_parser, e.g. "tree_count") to the values to try.
+    - seeds: The seeds to generate every combination with.
+
+    Returns:
+    - The list of parameter overrides.
+    '''
+    names = list(sweep)
+    jobs = []
+    for values in itertools.product(*(sweep[name] for name in names)):
+        for seed in seeds:
+            params = dict(zip(names, values))
+            params["seed"] = seed
+            jobs.append(params)
+
+    return jobs
+
+def scene_file_name(overrides: dict) -> str:
+    '''
+    Names the scene file of a parameter override dict by its seed and a hash of all its parameters,
+    so every distinct scene has its own file across runs, and the same scene always the same file.
+
+    Parameters:
+    - overrides: The parameter overrides of the scene.
+
+    Returns:
+    - The file name of the scene.
+    '''
+    params_hash = hashlib.sha256(json.dumps(overrides, sort_keys=True).encode()).hexdigest()[:12]
+
+    return f"scene_s{overrides.get('seed', 0)}_{params_hash}.blend"
+
+def build_scene_job(job: tuple[int, dict, str]) -> dict:
+    '''
+    Builds one scene in a worker process. a scene that fails gets an error record instead,
+    so one bad scene doesn't stop the pool, and is built again by the next run.
+
+    Parameters:
+    - job: The scene index, the parameter overrides and the output directory.
+
+    Returns:
+    - The manifest record of the scene, with status "ok", or "error" and the traceback.
+    '''
+    from utils import reset_scene
+    from forrestGeneration import parse_scene_params, generate_scene
+
+    index, overrides, output_dir = job
+    output_path = os.path.join(output_dir, scene_file_name(overrides))
+
+    try:
+        # the worker may have built other scenes before
+        reset_scene(keep_fake_users=True)
+
+        args = parse_scene_params(overrides)
+        args.output_path = output_path
+
+        stats = generate_scene(args)
+    except Exception:
+        return {"index": index, "output_path": output_path, "params": overrides, "status": "error",
+                "error": traceback.format_exc()}
+
+    return {"index": index, "output_path": output_path, "params": vars(args), "status": "ok", "stats": stats}
+
+def generate_dataset(jobs: list[dict], output_dir: str, workers: int):
+    '''
+    Builds all scenes on a process pool and writes a manifest.jsonl next to them.
+    scenes whose file already exists were built by an earlier run and are skipped,
+    so running again into the same directory only adds the missing scenes and retries the failed ones.
+
+    Parameters:
+    - jobs: The parameter overrides of every scene.
+    - output_dir: The directory to save the scenes and the manifest to.
+    - workers: The number of worker processes.
+
+    Returns:
+    - None
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    # repeated parameter overrides are the same scene, build it once
+    unique_jobs = {scene_file_name(params): params for params in jobs}
+    tasks = [(index, params, output_dir) for index, (name, params) in enumerate(unique_jobs.items())
+             if not os.path.exists(os.path.join(output_dir, name))]
+    print(f"{len(unique_jobs) - len(tasks)} of {len(unique_jobs)} scenes already exist")
+
+    # spawn so every worker gets its own clean bpy
+    context = multiprocessing.get_context("spawn")
+    failed = 0
+    with context.Pool(workers) as pool, open(os.path.join(output_dir, "manifest.jsonl"), "a") as manifest:
+        for record in pool.imap_unordered(build_scene_job, tasks):
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            if record["status"] == "ok":
+                print(f"scene {record['index']} saved to {record['output_path']}")
+            else:
+                failed += 1
+                print(f"scene {record['index']} failed:\n{record['error']}", file=sys.stderr)
+    if failed:
+        print(f"{failed} of {len(tasks)} scenes failed, see the error records in the manifest", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate many Blender fire scenes in parallel.")
+
+    parser.add_argument("--seeds", type=str, default="0:10",
+                        help="Seed range start:stop or comma separated seeds")
+    parser.add_argument("--sweep", type=str, default=None,
+                        help="JSON file mapping scene parameters to lists of values to sweep")
+    parser.add_argument("--output-dir", type=str, default=os.path.join("terrains", "dataset"),
+                        help="Directory to save the scenes and the manifest to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes")
+
+    args = parser.parse_args()
+
+    sweep: dict[str, list] = {}
+    if args.sweep is not None:
+        with open(args.sweep) as sweep_file:
+            sweep = json.load(sweep_file)
+
+    jobs = expand_sweep(sweep, parse_seed_range(args.seeds))
+    generate_dataset(jobs, os.path.join(os.getcwd(), args.output_dir), args.workers)
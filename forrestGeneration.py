@@ -1,23 +1,46 @@
 import os
+import json
+import math
 import argparse
-import random
+import bpy
+import numpy as np
 
-from terrain import generate_blender_terrain
-from vegetation import generate_trees, add_burning_tree
+from seeding import stage_rng, stage_seed
+from terrain import generate_blender_terrain, mip_size
+import vegetation
+from vegetation import generate_trees, add_burning_trees
 from light import add_light
-from utils import clear, save_scene_to_file
-from path import generate_curve
-from camera import add_camera, look_at_curve
+from ignite import apply_fire_resolution_policies, bake_fire_domains
+from utils import clear, save_scene_to_file, evict_cache
+from path import curve_from_points, curve_points, generate_curve, sample_control_points, sample_path, terrain_clearance
+from camera import add_camera, bake_camera_path, look_at_curve
+from profiling import SceneProfiler
 
-if __name__ == "__main__":
+def build_parser() -> argparse.ArgumentParser:
+    '''
+    Builds the command line parser of the scene generation parameters.
+
+    Returns:
+    - The argument parser.
+    '''
     parser = argparse.ArgumentParser(description="Generate a Blender scene with terrain, trees, and a burning tree.")
 
     parser.add_argument("--terrain-texture-path", type=str,
                         default="textures/grass-terrain/textures/rocky_terrain_02_diff_4k.jpg",
-                        help="Path to terrain texture")
+                        help="Path to terrain texture, or to a .blend file under textures/ to link its material from")
+    parser.add_argument("--terrain-material", type=str, default=None,
+                        help="Name of the material to link from a .blend terrain texture, needed when it has several")
+    parser.add_argument("--link-models", action="store_true",
+                        help="Link tree models from .blend libraries instead of importing them into the scene")
+    parser.add_argument("--texture-size", type=str, default="full",
+                        help="Largest terrain texture side in pixels, \"full\", or \"auto\" to match the render resolution")
     parser.add_argument("--output-path", type=str,
                         default=os.path.join("terrains", "terrain.blend"),
                         help="Path to save the output blend file")
+    parser.add_argument("--compress", action="store_true",
+                        help="Save the blend file compressed")
+    parser.add_argument("--base-library", type=str, default=None,
+                        help="Directory to save the shared terrain and vegetation data to once, linked from the scene")
     parser.add_argument("--xpix", type=int, default=100,
                         help="Number of pixels in x dimension")
     parser.add_argument("--ypix", type=int, default=100,
@@ -27,10 +50,44 @@ if __name__ == "__main__":
     parser.add_argument("--ruggedness", type=float, default=0.5,
                         help="Ruggedness of terrain")
 
+    parser.add_argument("--terrain-cache-dir", type=str, default=os.path.join("cache", "terrain"),
+                        help="Directory of cached heightmaps, empty to disable the cache")
+    parser.add_argument("--terrain-cache-max-gb", type=float, default=2.0,
+                        help="Evict the least recently used heightmaps above this size")
+    parser.add_argument("--terrain-lod", action="store_true",
+                        help="Build the terrain with coarser tiles far from the camera path")
+    parser.add_argument("--lod-tile-size", type=int, default=32,
+                        help="Number of cells along a level of detail tile side")
+    parser.add_argument("--lod-distances", type=float, nargs="+", default=(40, 80, 160),
+                        help="Distances from the camera path at which the terrain resolution halves")
     parser.add_argument("--tree-count", type=int, default=60,
                         help="Number of trees to generate")
+    parser.add_argument("--tree-mode", type=str, default="objects", choices=["objects", "scatter"],
+                        help="Place trees as separate objects or scatter them with geometry nodes")
+    parser.add_argument("--max-slope", type=float, default=None,
+                        help="Steepest terrain slope in degrees to place trees on")
+    parser.add_argument("--cull-trees", type=str, default="none", choices=["none", "hide", "skip"],
+                        help="Hide trees the camera never sees from render, or don't create them")
     parser.add_argument("--tree-on-fire-position", type=tuple, default=(50, 50),
                         help="Position of burning tree")
+    parser.add_argument("--fire-fraction", type=float, default=0.0,
+                        help="Fraction of the forest trees to also set on fire")
+    parser.add_argument("--fire-cluster-radius", type=float, default=20.0,
+                        help="Fires closer than this share one simulation domain, as do fires whose domains would overlap")
+    parser.add_argument("--bake-fire", action="store_true",
+                        help="Bake the fire simulation, reusing bakes with the same settings from the fire cache")
+    parser.add_argument("--fire-voxels-per-pixel", type=float, default=1.0,
+                        help="Fire simulation voxels per pixel the fire domain covers on screen")
+    parser.add_argument("--fire-cache-dir", type=str, default=os.path.join("cache", "fire"),
+                        help="Directory of the fire simulation bakes")
+    parser.add_argument("--fire-cache-max-gb", type=float, default=None,
+                        help="Evict the least recently used fire bakes above this size")
+    parser.add_argument("--fire-cache-max-days", type=float, default=None,
+                        help="Evict fire bakes unused for longer than this")
+    parser.add_argument("--stats-path", type=str, default=None,
+                        help="JSON lines file to append the stage timings of the scene to")
+    parser.add_argument("--cprofile-path", type=str, default=None,
+                        help="File to write a cProfile of the scene build to")
     parser.add_argument("--seed", type=int, default=0, help="Random seed for generation")
 
     parser.add_argument("--light-type", type=str, default="SUN",
@@ -49,13 +106,52 @@ if __name__ == "__main__":
     parser.add_argument("--point-count", type=int, default=8,
                         help="Number of points in camera curve")
 
+    parser.add_argument("--camera-mode", type=str, default="constraints", choices=["constraints", "baked"],
+                        help="Animate the camera with path constraints, or bake precomputed keyframes")
+    parser.add_argument("--camera-clearance", type=float, default=2.0,
+                        help="Smallest height of the baked camera above the terrain")
+    parser.add_argument("--path-smoothing", type=int, default=9,
+                        help="Moving average window in frames of the baked camera heights")
+
     parser.add_argument("--path-duration", type=int, default=200,
                         help="Duration of camera path")
+    parser.add_argument("--render-resolution", type=int, nargs=2, default=(144, 144),
+                        help="Resolution the scene will be rendered at")
+    parser.add_argument("--render-fov", type=float, default=30.0,
+                        help="Field of view in degrees the scene will be rendered with")
     parser.add_argument("--camera-location", type=tuple, default=(50, 50, 100),
                             help="Location of camera")
 
-    args = parser.parse_args()
+    return parser
+
+def parse_scene_params(params: dict) -> argparse.Namespace:
+    '''
+    Returns the default scene parameters with some of them overridden, e.g. from a JSON job or sweep.
+
+    Parameters:
+    - params: Maps parameter names (as in build_parser, e.g. "tree_count") to their values, lists become tuples.
+
+    Returns:
+    - The scene parameters.
+    '''
+    args = build_parser().parse_args([])
+    for name, value in params.items():
+        if not hasattr(args, name):
+            raise ValueError(f"unknown scene parameter {name}")
+        setattr(args, name, tuple(value) if isinstance(value, list) else value)
+
+    return args
+
+def generate_scene(args: argparse.Namespace):
+    '''
+    Generates a scene with terrain, trees, a burning tree, light and a camera path, and saves it.
+
+    Parameters:
+    - args: The scene generation parameters, as parsed by build_parser.
 
+    Returns:
+    - The profiling record of the scene, with the time, memory and datablock counts of every stage.
+    '''
     terrain_texture_path: str = os.path.join(os.getcwd(), args.terrain_texture_path)
     file_path: str = os.path.join(os.getcwd(), args.output_path)
     xpix: int = args.xpix
@@ -64,10 +160,14 @@ if __name__ == "__main__":
     ruggedness: float = args.ruggedness
 
     tree_count: int = args.tree_count
+    tree_mode: str = args.tree_mode
+    max_slope: float = args.max_slope
     tree_on_fire_position: tuple = args.tree_on_fire_position
 
+    vegetation.linked_models = args.link_models
+
+    # every stage draws from its own stream of the scene seed, so stages don't depend on each other's draws
     seed: int = args.seed
-    random.seed(args.seed)
 
     light_type: str = args.light_type
     light_location: tuple = args.light_location
@@ -82,14 +182,84 @@ if __name__ == "__main__":
     curve_scale: float = args.curve_scale
     point_count: int = args.point_count
 
-    clear()
+    profiler = SceneProfiler(cprofile=args.cprofile_path is not None)
+
+    with profiler.stage("clear"):
+        clear()
+
+    with profiler.stage("curve"):
+        if args.camera_mode == "baked":
+            control_points = sample_control_points(curve_offset, curve_scale, point_count, stage_rng(seed, "curve"))
+            curve = curve_from_points(control_points, catmull_rom=True)
+        else:
+            curve = generate_curve(curve_offset, curve_scale, point_count, stage_rng(seed, "curve"))
+
+    with profiler.stage("terrain"):
+        lod_path_points = curve_points(curve) if args.terrain_lod else None
+        terrain_cache_dir = os.path.join(os.getcwd(), args.terrain_cache_dir) if args.terrain_cache_dir else None
+        if args.texture_size == "full":
+            texture_size = None
+        elif args.texture_size == "auto":
+            texture_size = mip_size(args.render_resolution)
+        else:
+            texture_size = int(args.texture_size)
+        mesh, heightmap = generate_blender_terrain(terrain_texture_path, xpix, ypix, height_variation, ruggedness,
+                                                   stage_seed(seed, "terrain"),
+                                                   lod_path_points, args.lod_tile_size, tuple(args.lod_distances),
+                                                   terrain_cache_dir, int(args.terrain_cache_max_gb * 1024**3),
+                                                   texture_size, args.terrain_material)
+    # the camera path comes before the trees, so trees it never sees can be culled
+    with profiler.stage("camera"):
+        camera = add_camera(camera_location, camera_rotation)
+        camera.data.angle = math.radians(args.render_fov)
+        bpy.context.scene.render.resolution_x, bpy.context.scene.render.resolution_y = args.render_resolution
+    if args.camera_mode == "baked":
+        with profiler.stage("bake_camera_path"):
+            targets = terrain_clearance(sample_path(control_points, path_duration), heightmap, 0.0,
+                                        args.path_smoothing)
+            locations = terrain_clearance(np.tile(np.asarray(camera_location, dtype=float), (path_duration, 1)),
+                                          heightmap, args.camera_clearance, args.path_smoothing)
+            bake_camera_path(camera, locations, targets)
+    else:
+        with profiler.stage("look_at_curve"):
+            curve = look_at_curve(camera, curve, path_duration)
+    with profiler.stage("trees"):
+        trees = generate_trees(tree_count, xpix, ypix, mesh, tree_mode, heightmap, max_slope, args.cull_trees,
+                               camera, list(range(1, path_duration + 1)), stage_rng(seed, "trees"))
+    with profiler.stage("burning_trees"):
+        visible_trees = [tree for tree in trees if not tree.hide_render]
+        add_burning_trees([tree_on_fire_position], heightmap, visible_trees, args.fire_fraction,
+                          args.fire_cluster_radius, stage_rng(seed, "fire"))
+    with profiler.stage("fire_resolution"):
+        fire_reports = apply_fire_resolution_policies(camera, 1, path_duration, tuple(args.render_resolution),
+                                                      args.fire_voxels_per_pixel)
+    with profiler.stage("light"):
+        add_light(light_type, light_location, light_strength, light_color)
 
-    add_burning_tree(tree_on_fire_position)
-    mesh = generate_blender_terrain(terrain_texture_path, xpix, ypix, height_variation, ruggedness, seed)
-    generate_trees(tree_count, xpix, ypix, mesh)
-    add_light(light_type, light_location, light_strength, light_color)
-    camera = add_camera(camera_location, camera_rotation)
-    curve = generate_curve(curve_offset, curve_scale, point_count)
-    curve = look_at_curve(camera, curve, path_duration)
+    if args.bake_fire:
+        with profiler.stage("bake_fire"):
+            fire_cache_dir = os.path.join(os.getcwd(), args.fire_cache_dir)
+            bake_reports = bake_fire_domains(fire_cache_dir, 1, path_duration)
+            for name, report in bake_reports.items():
+                fire_reports[name].update(report)
+            print(json.dumps(fire_reports, indent=2))
+            evict_cache(fire_cache_dir,
+                        None if args.fire_cache_max_gb is None else int(args.fire_cache_max_gb * 1024**3),
+                        None if args.fire_cache_max_days is None else args.fire_cache_max_days * 24 * 3600,
+                        keep=tuple(report["cache_dir"] for report in bake_reports.values()))
 
-    save_scene_to_file(file_path)
+    with profiler.stage("save"):
+        base_library = os.path.join(os.getcwd(), args.base_library) if args.base_library else None
+        save_scene_to_file(file_path, args.compress, base_library=base_library)
+
+    print(profiler.summary())
+    if args.stats_path is not None:
+        profiler.write_record(args.stats_path, output_path=file_path, params=vars(args), fire=fire_reports)
+    if args.cprofile_path is not None:
+        profiler.dump_profile(args.cprofile_path)
+
+    return profiler.record(fire=fire_reports)
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    generate_scene(args)
@@ -1,28 +1,60 @@
+import os
+import json
+import math
+import time
+import hashlib
 import bpy
+import numpy as np
+from mathutils import Vector
+from bpy_extras.object_utils import world_to_camera_view
+from utils import atomic_write, directory_size, peak_rss_mb
 
-def add_fire_and_smoke(tree_obj):
+def fire_domain_box(tree_objs):
     """
-    Adds fire and smoke to a tree object using a simplified and more reliable approach.
+    Computes the box of the gas simulation domain around one or more tree objects.
 
     Args:
-    tree_obj: bpy.types.Object: The tree object to add fire and smoke to
+    tree_objs: list[bpy.types.Object]: The trees the domain has to contain
 
     Returns:
-    bpy.types.Object: The domain object created for the fire simulation
+    tuple[np.ndarray, np.ndarray]: The center and the size of the domain
     """
-    # Store the tree's dimensions and location
-    tree_dims = tree_obj.dimensions
-    tree_loc = tree_obj.location
+    # Store the trees' dimensions and locations
+    tree_dims = [max(tree_obj.dimensions) for tree_obj in tree_objs]
+    tree_heights = [tree_obj.dimensions.z for tree_obj in tree_objs]
+    tree_locs = np.array([tuple(tree_obj.location) for tree_obj in tree_objs])
+    low, high = tree_locs.min(axis=0), tree_locs.max(axis=0)
 
     # Calculate domain size based on tree dimensions (with some extra space)
-    domain_size = max(tree_dims) * 4
-    domain_height = tree_dims.z * 6  # Extra height for smoke to rise
+    domain_size_x = high[0] - low[0] + max(tree_dims) * 4
+    domain_size_y = high[1] - low[1] + max(tree_dims) * 4
+    domain_height = max(tree_heights) * 6  # Extra height for smoke to rise
+
+    # positioned above the trees to allow smoke to rise
+    center = (low + high) / 2
+    center[2] = low[2] + domain_height / 4
+
+    return center, np.array([domain_size_x, domain_size_y, domain_height])
 
-    # Add a cube for the domain, positioned above the tree to allow smoke to rise
-    bpy.ops.mesh.primitive_cube_add(size=1.0,location=(tree_loc.x, tree_loc.y, tree_loc.z + domain_height/4))
+def add_fire_domain(tree_objs):
+    """
+    Adds a gas simulation domain around one or more tree objects.
+    only the given trees are flows of the domain, through a collection in its fluid group,
+    so the flows of other domains reaching into it are not simulated twice.
+
+    Args:
+    tree_objs: list[bpy.types.Object]: The trees the domain has to contain
+
+    Returns:
+    bpy.types.Object: The domain object created for the fire simulation
+    """
+    center, size = fire_domain_box(tree_objs)
+
+    # Add a cube for the domain
+    bpy.ops.mesh.primitive_cube_add(size=1.0, location=tuple(center))
     domain = bpy.context.object
-    domain.name = f"FireDomain_{tree_obj.name}"
-    domain.scale = (domain_size, domain_size, domain_height)
+    domain.name = f"FireDomain_{tree_objs[0].name}"
+    domain.scale = tuple(size)
 
     # Add the fluid modifier to the domain
     bpy.context.view_layer.objects.active = domain
@@ -42,7 +74,34 @@ def add_fire_and_smoke(tree_obj):
     domain_settings.flame_max_temp = 3.0
     domain_settings.vorticity = 0.2
 
-    # Now set up the tree as the flow object
+    flows = bpy.data.collections.new(f"FireFlows_{tree_objs[0].name}")
+    for tree_obj in tree_objs:
+        flows.objects.link(tree_obj)
+    domain_settings.fluid_group = flows
+
+    # volume material so smoke and flames render in cycles and eevee
+    material = bpy.data.materials.new(name=f"FireMaterial_{tree_objs[0].name}")
+    material.use_nodes = True
+    material.node_tree.nodes.clear()
+    nodes = material.node_tree.nodes
+    principled_volume = nodes.new('ShaderNodeVolumePrincipled')
+    principled_volume.inputs["Blackbody Intensity"].default_value = 1.0
+    material_output = nodes.new('ShaderNodeOutputMaterial')
+    material.node_tree.links.new(principled_volume.outputs["Volume"], material_output.inputs["Volume"])
+    domain.data.materials.append(material)
+
+    return domain
+
+def add_fire_flow(tree_obj):
+    """
+    Sets up a tree object as a fire flow source.
+
+    Args:
+    tree_obj: bpy.types.Object: The tree object to set on fire
+
+    Returns:
+    bpy.types.Object: The tree object
+    """
     bpy.context.view_layer.objects.active = tree_obj
     tree_obj.select_set(True)
     bpy.ops.object.modifier_add(type='FLUID')
@@ -61,4 +120,445 @@ def add_fire_and_smoke(tree_obj):
     flow_settings.temperature = 2.0
     flow_settings.velocity_factor = 0.5
 
+    return tree_obj
+
+def add_fire_and_smoke(tree_obj):
+    """
+    Adds fire and smoke to a tree object using a simplified and more reliable approach.
+
+    Args:
+    tree_obj: bpy.types.Object: The tree object to add fire and smoke to
+
+    Returns:
+    bpy.types.Object: The domain object created for the fire simulation
+    """
+    domain = add_fire_domain([tree_obj])
+    add_fire_flow(tree_obj)
+
     return domain
+
+def find_root(parents, index):
+    """
+    Finds the root of an element in a union-find forest, halving the path on the way.
+
+    Args:
+    parents: list[int]: The parent of every element, roots are their own parent
+    index: int: The element
+
+    Returns:
+    int: The root of the element's set
+    """
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+
+    return index
+
+def union(parents, first, second):
+    """
+    Joins the sets of two elements of a union-find forest.
+
+    Args:
+    parents: list[int]: The parent of every element, roots are their own parent
+    first: int: An element of the first set
+    second: int: An element of the second set
+
+    Returns:
+    bool: Whether the elements were in different sets
+    """
+    first, second = find_root(parents, first), find_root(parents, second)
+    if first == second:
+        return False
+    parents[max(first, second)] = min(first, second)
+
+    return True
+
+def set_labels(parents):
+    """
+    Numbers the sets of a union-find forest in the order their first element appears.
+
+    Args:
+    parents: list[int]: The parent of every element, roots are their own parent
+
+    Returns:
+    np.ndarray: The set label of every element, labels are 0..K-1
+    """
+    roots = np.array([find_root(parents, index) for index in range(len(parents))], dtype=int)
+    _, first, inverse = np.unique(roots, return_index=True, return_inverse=True)
+
+    return np.argsort(np.argsort(first))[inverse]
+
+def cluster_positions(positions, radius):
+    """
+    Groups positions into clusters where every position is within radius (in the xy plane)
+    of another position of its cluster, i.e. single linkage clustering.
+    positions are bucketed into grid cells of the radius, so only positions in neighbouring cells are compared.
+
+    Args:
+    positions: np.ndarray: (N, 2) or (N, 3) array of positions
+    radius: float: The linking distance
+
+    Returns:
+    np.ndarray: The cluster label of every position, labels are 0..K-1
+    """
+    positions = np.asarray(positions, dtype=float)[:, :2]
+    cell_size = radius if radius > 0 else 1.0
+
+    cells = {}
+    for index, cell in enumerate(map(tuple, np.floor(positions / cell_size).astype(int))):
+        cells.setdefault(cell, []).append(index)
+
+    parents = list(range(len(positions)))
+    for (x, y), members in cells.items():
+        # every pair of cells is compared once, from the cell with the lower coordinates
+        for offset in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+            others = cells.get((x + offset[0], y + offset[1]))
+            if others is None:
+                continue
+            distances = np.linalg.norm(positions[members][:, None] - positions[others][None, :], axis=-1)
+            for first, second in zip(*np.nonzero(distances <= radius)):
+                union(parents, members[first], others[second])
+
+    return set_labels(parents)
+
+def merge_overlapping_clusters(tree_objs, labels):
+    """
+    Merges clusters of trees whose simulation domains would intersect, until no two domains do.
+    overlapping domains are found by sweeping the boxes sorted along x and joined with union-find,
+    a merged domain is larger, so the sweep repeats while it still merges clusters.
+
+    Args:
+    tree_objs: list[bpy.types.Object]: The clustered trees
+    labels: np.ndarray: The cluster label of every tree, labels are 0..K-1
+
+    Returns:
+    np.ndarray: The merged cluster label of every tree, labels are 0..K'-1
+    """
+    labels = np.array(labels)
+    merged = True
+    while merged:
+        clusters = [[] for _ in range(labels.max() + 1)]
+        for tree_obj, label in zip(tree_objs, labels):
+            clusters[label].append(tree_obj)
+        boxes = [fire_domain_box(cluster) for cluster in clusters]
+        lows = np.array([center - size / 2 for center, size in boxes])
+        highs = np.array([center + size / 2 for center, size in boxes])
+
+        parents = list(range(len(boxes)))
+        merged = False
+        active = []
+        for cluster in np.argsort(lows[:, 0], kind="stable"):
+            active = [other for other in active if highs[other, 0] > lows[cluster, 0]]
+            for other in active:
+                if (lows[cluster] < highs[other]).all() and (lows[other] < highs[cluster]).all():
+                    merged |= union(parents, cluster, other)
+            active.append(cluster)
+        labels = set_labels(parents)[labels]
+
+    return labels
+
+def add_fires(tree_objs, cluster_radius):
+    """
+    Sets several trees on fire with as few simulation domains as possible: trees closer than
+    cluster_radius to each other share one domain, and so do clusters whose domains would intersect,
+    so the simulation cost follows the burning area and not the number of burning trees.
+
+    Args:
+    tree_objs: list[bpy.types.Object]: The trees to set on fire
+    cluster_radius: float: Trees within this distance of each other share a domain
+
+    Returns:
+    list[bpy.types.Object]: The domain objects created for the fire simulations
+    """
+    if not tree_objs:
+        return []
+
+    labels = cluster_positions([tuple(tree_obj.location) for tree_obj in tree_objs], cluster_radius)
+    labels = merge_overlapping_clusters(tree_objs, labels)
+    domains = []
+    for label in range(labels.max() + 1):
+        cluster = [tree_obj for tree_obj, tree_label in zip(tree_objs, labels) if tree_label == label]
+        domains.append(add_fire_domain(cluster))
+        for tree_obj in cluster:
+            add_fire_flow(tree_obj)
+
+    return domains
+
+def fluid_settings_dict(settings) -> dict:
+    """
+    Collects the editable values of fluid domain or flow settings, cache paths and bake state excluded.
+
+    Args:
+    settings: bpy.types.FluidDomainSettings or bpy.types.FluidFlowSettings: The settings to collect
+
+    Returns:
+    dict: The setting values by property name
+    """
+    values = {}
+    for prop in settings.bl_rna.properties:
+        if prop.type in {'POINTER', 'COLLECTION'} or prop.is_readonly or prop.identifier.startswith("cache"):
+            continue
+        value = getattr(settings, prop.identifier)
+        if isinstance(value, set):
+            value = sorted(value)
+        elif getattr(prop, "array_length", 0):
+            value = list(value)
+        values[prop.identifier] = value
+
+    return values
+
+def fire_cache_key(domain, flows, frame_start, frame_end):
+    """
+    Hashes everything the fire simulation of a domain depends on: the domain and flow settings,
+    the domain placement, the flow geometry and placement, and the simulated frame range.
+    the domain's world matrix is part of the key because mantaflow stores it in the bake,
+    so a bake is only reused by a fire at the same spot.
+
+    Args:
+    domain: bpy.types.Object: The fire domain
+    flows: list[bpy.types.Object]: The flow objects inside the domain
+    frame_start: int: The first simulated frame
+    frame_end: int: The last simulated frame
+
+    Returns:
+    str: The cache key
+    """
+    hasher = hashlib.sha256()
+    description = {
+        "domain": fluid_settings_dict(domain.modifiers["Fluid"].domain_settings),
+        "domain_dimensions": list(domain.dimensions),
+        "domain_matrix": [list(row) for row in domain.matrix_world],
+        "frames": [frame_start, frame_end],
+        "flows": [fluid_settings_dict(flow.modifiers["Fluid"].flow_settings) for flow in flows],
+    }
+    hasher.update(json.dumps(description, sort_keys=True, default=str).encode())
+
+    for flow in flows:
+        mesh = flow.data
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        loops = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loops)
+        hasher.update(co.tobytes())
+        hasher.update(loops.tobytes())
+        hasher.update(np.array(flow.matrix_world.to_3x3(), dtype=np.float32).tobytes())
+        hasher.update(np.array(flow.location - domain.location, dtype=np.float32).tobytes())
+
+    return hasher.hexdigest()[:32]
+
+def domain_flows(domain):
+    """
+    Finds the fluid flow objects of a domain: the objects of its fluid group,
+    or without a group, the flows whose origin is inside the domain.
+
+    Args:
+    domain: bpy.types.Object: The fire domain
+
+    Returns:
+    list[bpy.types.Object]: The flow objects, sorted by name
+    """
+    fluid_group = domain.modifiers["Fluid"].domain_settings.fluid_group
+    if fluid_group is not None:
+        return sorted(fluid_group.objects, key=lambda obj: obj.name)
+
+    half_size = domain.dimensions / 2
+    flows = []
+    for obj in bpy.context.scene.objects:
+        fluid = obj.modifiers.get("Fluid")
+        if fluid is None or fluid.fluid_type != 'FLOW':
+            continue
+        offset = obj.location - domain.location
+        if all(abs(offset[axis]) <= half_size[axis] for axis in range(3)):
+            flows.append(obj)
+
+    return sorted(flows, key=lambda obj: obj.name)
+
+def bake_fire(domain, cache_root, frame_start, frame_end):
+    """
+    Bakes the fire simulation of a domain into a cache directory keyed by fire_cache_key,
+    or points the domain at an existing bake with the same key.
+    bakes are written with utils.atomic_write, so the first of several workers baking the same key wins.
+    a failed or cancelled bake raises a RuntimeError and its partial cache is removed, a bake killed
+    with its process is left as a .part directory for utils.evict_cache.
+
+    Args:
+    domain: bpy.types.Object: The fire domain
+    cache_root: str: The directory holding all fire bakes
+    frame_start: int: The first simulated frame
+    frame_end: int: The last simulated frame
+
+    Returns:
+    tuple[str, bool]: The cache directory of the domain, and whether an existing bake was reused
+    """
+    domain_settings = domain.modifiers["Fluid"].domain_settings
+    domain_settings.cache_type = 'ALL'
+    domain_settings.cache_frame_start = frame_start
+    domain_settings.cache_frame_end = frame_end
+
+    key = fire_cache_key(domain, domain_flows(domain), frame_start, frame_end)
+    cache_dir = os.path.join(cache_root, key)
+    if os.path.isdir(cache_dir):
+        os.utime(cache_dir)
+        domain_settings.cache_directory = cache_dir
+        return cache_dir, True
+
+    def bake(bake_dir):
+        domain_settings.cache_directory = bake_dir
+        with bpy.context.temp_override(object=domain, active_object=domain, selected_objects=[domain]):
+            result = bpy.ops.fluid.bake_all()
+        if result != {'FINISHED'}:
+            raise RuntimeError(f"fire bake of {domain.name} ended with {result}")
+
+    atomic_write(cache_dir, bake)
+    domain_settings.cache_directory = cache_dir
+
+    return cache_dir, False
+
+def unbaked_fire_domains(scene):
+    """
+    Finds the fire domains of a scene without a complete bake. an unbaked domain only simulates while the
+    frames are stepped one by one from the start, so it renders wrong when a render jumps to a frame.
+
+    Args:
+    scene: bpy.types.Scene: The scene to check
+
+    Returns:
+    list[str]: The names of the unbaked domains, sorted
+    """
+    unbaked = []
+    for obj in fire_domains(scene):
+        domain_settings = obj.modifiers["Fluid"].domain_settings
+        data_dir = os.path.join(bpy.path.abspath(domain_settings.cache_directory), "data")
+        if domain_settings.cache_type != 'ALL' or not os.path.isdir(data_dir) or not os.listdir(data_dir):
+            unbaked.append(obj.name)
+
+    return sorted(unbaked)
+
+def projected_domain_size(domain, camera, frames, resolution):
+    """
+    Finds the largest size in pixels the domain covers on screen over the given frames.
+    a domain partly behind the camera counts as filling the whole frame.
+
+    Args:
+    domain: bpy.types.Object: The fire domain
+    camera: bpy.types.Object: The render camera
+    frames: list[int]: The frames to sample the camera path at
+    resolution: tuple[int, int]: The render resolution in pixels
+
+    Returns:
+    float: The largest projected width or height of the domain in pixels
+    """
+    scene = bpy.context.scene
+    current_frame = scene.frame_current
+    corners = [domain.matrix_world @ Vector(corner) for corner in domain.bound_box]
+
+    size = 0.0
+    for frame in frames:
+        scene.frame_set(frame)
+        projected = np.array([world_to_camera_view(scene, camera, corner) for corner in corners])
+        if (projected[:, 2] <= 0).any():
+            size = float(max(resolution))
+            break
+
+        low = np.clip(projected[:, :2].min(axis=0), 0, 1)
+        high = np.clip(projected[:, :2].max(axis=0), 0, 1)
+        size = max(size, float(((high - low) * resolution).max()))
+
+    scene.frame_set(current_frame)
+
+    return size
+
+def apply_fire_resolution_policy(domain, camera, frames, resolution, voxels_per_pixel=1.0,
+                                 min_resolution=16, max_resolution=128):
+    """
+    Chooses the simulation resolution of a domain from its size on screen, so small or distant fires
+    don't pay for voxels that end up smaller than a pixel. sim cost grows with the cube of the resolution.
+    the adaptive domain, which only simulates the cells around the fire, is enabled for the larger grids.
+
+    Args:
+    domain: bpy.types.Object: The fire domain
+    camera: bpy.types.Object: The render camera
+    frames: list[int]: The frames to sample the camera path at
+    resolution: tuple[int, int]: The render resolution in pixels
+    voxels_per_pixel: float: Voxels along the domain per pixel it covers
+    min_resolution: int: The lowest allowed resolution_max
+    max_resolution: int: The highest allowed resolution_max
+
+    Returns:
+    dict: The projected size in pixels and the chosen settings
+    """
+    pixels = projected_domain_size(domain, camera, frames, resolution)
+    resolution_max = int(np.clip(math.ceil(pixels * voxels_per_pixel), min_resolution, max_resolution))
+
+    domain_settings = domain.modifiers["Fluid"].domain_settings
+    domain_settings.resolution_max = resolution_max
+    domain_settings.use_adaptive_domain = resolution_max >= 48
+    domain_settings.additional_res = 0
+    domain_settings.adapt_margin = 4
+    domain_settings.adapt_threshold = 0.02
+
+    return {"projected_pixels": pixels, "resolution_max": resolution_max,
+            "use_adaptive_domain": domain_settings.use_adaptive_domain}
+
+def fire_domains(scene):
+    """
+    Finds the fire domains of a scene.
+
+    Args:
+    scene: bpy.types.Scene: The scene to search
+
+    Returns:
+    list[bpy.types.Object]: The domain objects
+    """
+    return [obj for obj in scene.objects
+            if obj.modifiers.get("Fluid") is not None and obj.modifiers["Fluid"].fluid_type == 'DOMAIN']
+
+def apply_fire_resolution_policies(camera, frame_start, frame_end, resolution, voxels_per_pixel=1.0):
+    """
+    Chooses the resolution of every fire domain in the scene with apply_fire_resolution_policy,
+    whether or not the fire is baked afterwards.
+
+    Args:
+    camera: bpy.types.Object: The render camera, animated along its path
+    frame_start: int: The first frame of the camera path
+    frame_end: int: The last frame of the camera path
+    resolution: tuple[int, int]: The render resolution in pixels
+    voxels_per_pixel: float: Voxels along the domain per pixel it covers
+
+    Returns:
+    dict[str, dict]: The projected size and chosen settings of every domain by name
+    """
+    frames = list(range(frame_start, frame_end + 1, max(1, (frame_end - frame_start) // 16)))
+
+    return {domain.name: apply_fire_resolution_policy(domain, camera, frames, resolution, voxels_per_pixel)
+            for domain in fire_domains(bpy.context.scene)}
+
+def bake_fire_domains(cache_root, frame_start, frame_end):
+    """
+    Bakes or reuses the fire simulation of every fluid domain in the scene, at the resolution
+    the domains are set to, see apply_fire_resolution_policies.
+
+    Args:
+    cache_root: str: The directory holding all fire bakes
+    frame_start: int: The first simulated frame
+    frame_end: int: The last simulated frame
+
+    Returns:
+    dict[str, dict]: The bake report of every domain by name: cache directory, reuse,
+    bake time, peak memory and cache size
+    """
+    os.makedirs(cache_root, exist_ok=True)
+
+    reports = {}
+    for obj in fire_domains(bpy.context.scene):
+        start = time.perf_counter()
+        cache_dir, reused = bake_fire(obj, cache_root, frame_start, frame_end)
+        reports[obj.name] = {
+            "cache_dir": cache_dir,
+            "reused": reused,
+            "bake_seconds": time.perf_counter() - start,
+            "peak_rss_mb": peak_rss_mb(),
+            "cache_mb": directory_size(cache_dir) / 1024**2,
+        }
+
+    return reports
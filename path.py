@@ -1,39 +1,40 @@
 import bpy
-import random
+import numpy as np
+from mathutils.geometry import interpolate_bezier
+from terrain import sample_heightmap
 
-def generate_curve_bounded(bounding_square: tuple[float, float, float, float], offset: tuple[float, float, float], scale: float, point_count: int, seed: int) -> bpy.types.Object:
+def curve_from_points(control_points: np.ndarray, catmull_rom: bool = False) -> bpy.types.Object:
     """
-    Generates a random curve with the given offset, scale, point count, and seed.
+    Creates a Bezier curve object through the given control points.
 
     Parameters:
-    - bounding_square: The bounding square for the curve. min_x, max_x, min_y, max_y
-    - offset: The offset of the curve.
-    - scale: The scale of the curve.
-    - point_count: The number of points in the curve.
-    - seed: The seed for the random number generator.
+    - control_points: (P, 3) array of control points.
+    - catmull_rom: Give the points the handles of the Catmull-Rom spline through them, so the curve matches
+      sample_path exactly, instead of Blender's automatic handles.
 
     Returns:
-    - The generated curve object.
+    - The curve object.
     """
-    if point_count < 4:
-        raise ValueError("each curve must have at least 4 points")
-
     curve_data = bpy.data.curves.new(name='MyCurve', type='CURVE')
     curve_data.dimensions = '3D'
     curve_data.resolution_u = 12
 
     spline = curve_data.splines.new(type='BEZIER')
-    spline.bezier_points.add(point_count - 1)
+    spline.bezier_points.add(len(control_points) - 1)
 
-    min_x, max_x, min_y, max_y = bounding_square
     points = spline.bezier_points
-    for i, point in enumerate(points):
-        x = random.uniform(min_x, max_x) + offset[0]
-        y = random.uniform(min_y, max_y) + offset[1]
-        z = random.uniform(-scale, scale) + offset[2]
-        point.co = (x, y, z)
-        point.handle_left_type = 'AUTO'
-        point.handle_right_type = 'AUTO'
+    points.foreach_set("co", np.asarray(control_points, dtype=np.float32).ravel())
+    handle_type = 'FREE' if catmull_rom else 'AUTO'
+    for point in points:
+        point.handle_left_type = handle_type
+        point.handle_right_type = handle_type
+
+    if catmull_rom:
+        segments = catmull_rom_segments(control_points)
+        right = np.concatenate((segments[:, 1], [2 * segments[-1, 3] - segments[-1, 2]]))
+        left = np.concatenate(([2 * segments[0, 0] - segments[0, 1]], segments[:, 2]))
+        points.foreach_set("handle_right", right.astype(np.float32).ravel())
+        points.foreach_set("handle_left", left.astype(np.float32).ravel())
 
     curve_obj = bpy.data.objects.new('MyCurveObject', curve_data)
 
@@ -41,14 +42,16 @@ def generate_curve_bounded(bounding_square: tuple[float, float, float, float], o
 
     return curve_obj
 
-def generate_curve(offset: tuple[float, float, float], scale: float, point_count: int) -> bpy.types.Object:
+def generate_curve_bounded(bounding_square: tuple[float, float, float, float], offset: tuple[float, float, float], scale: float, point_count: int, seed: int) -> bpy.types.Object:
     """
     Generates a random curve with the given offset, scale, point count, and seed.
 
     Parameters:
+    - bounding_square: The bounding square for the curve. min_x, max_x, min_y, max_y
     - offset: The offset of the curve.
     - scale: The scale of the curve.
     - point_count: The number of points in the curve.
+    - seed: The seed for the random number generator, e.g. from seeding.stage_seed.
 
     Returns:
     - The generated curve object.
@@ -56,24 +59,148 @@ def generate_curve(offset: tuple[float, float, float], scale: float, point_count
     if point_count < 4:
         raise ValueError("each curve must have at least 4 points")
 
-    curve_data = bpy.data.curves.new(name='MyCurve', type='CURVE')
-    curve_data.dimensions = '3D'
-    curve_data.resolution_u = 12
+    min_x, max_x, min_y, max_y = bounding_square
+    rng = np.random.default_rng(seed)
+    control_points = rng.uniform((min_x, min_y, -scale), (max_x, max_y, scale), (point_count, 3)) + offset
 
-    spline = curve_data.splines.new(type='BEZIER')
-    spline.bezier_points.add(point_count - 1)
+    return curve_from_points(control_points)
 
-    points = spline.bezier_points
-    for i, point in enumerate(points):
-        x = random.uniform(-scale, scale) + offset[0]
-        y = random.uniform(-scale, scale) + offset[1]
-        z = random.uniform(-scale, scale) + offset[2]
-        point.co = (x, y, z)
-        point.handle_left_type = 'AUTO'
-        point.handle_right_type = 'AUTO'
+def sample_control_points(offset: tuple[float, float, float], scale: float, point_count: int,
+                          rng: np.random.Generator = None) -> np.ndarray:
+    """
+    Draws the random control points of a camera curve.
 
-    curve_obj = bpy.data.objects.new('MyCurveObject', curve_data)
+    Parameters:
+    - offset: The offset of the curve.
+    - scale: The scale of the curve.
+    - point_count: The number of points in the curve.
+    - rng: The random generator, None uses a new unseeded one.
 
-    bpy.context.scene.collection.objects.link(curve_obj)
+    Returns:
+    - (point_count, 3) array of control points.
+    """
+    if point_count < 4:
+        raise ValueError("each curve must have at least 4 points")
 
-    return curve_obj
+    rng = rng if rng is not None else np.random.default_rng()
+
+    return rng.uniform(-scale, scale, (point_count, 3)) + offset
+
+def generate_curve(offset: tuple[float, float, float], scale: float, point_count: int,
+                   rng: np.random.Generator = None) -> bpy.types.Object:
+    """
+    Generates a random curve with the given offset, scale, point count, and random generator.
+
+    Parameters:
+    - offset: The offset of the curve.
+    - scale: The scale of the curve.
+    - point_count: The number of points in the curve.
+    - rng: The random generator, None uses a new unseeded one.
+
+    Returns:
+    - The generated curve object.
+    """
+    return curve_from_points(sample_control_points(offset, scale, point_count, rng))
+
+def catmull_rom_segments(control_points: np.ndarray) -> np.ndarray:
+    """
+    Converts the Catmull-Rom spline through the control points to cubic Bezier segments.
+    the spline passes through every control point, the end points are extended linearly.
+
+    Parameters:
+    - control_points: (P, 3) array of control points.
+
+    Returns:
+    - (P - 1, 4, 3) array of the Bezier control points of every segment.
+    """
+    points = np.asarray(control_points, dtype=float)
+    padded = np.concatenate(([2 * points[0] - points[1]], points, [2 * points[-1] - points[-2]]))
+
+    return np.stack((padded[1:-2],
+                     padded[1:-2] + (padded[2:-1] - padded[:-3]) / 6,
+                     padded[2:-1] - (padded[3:] - padded[1:-2]) / 6,
+                     padded[2:-1]), axis=1)
+
+def sample_path(control_points: np.ndarray, samples: int, resolution: int = 32) -> np.ndarray:
+    """
+    Samples the Catmull-Rom spline through the control points at evenly spaced distances along it,
+    so an object moving along the samples one per frame moves at a constant speed.
+
+    Parameters:
+    - control_points: (P, 3) array of control points.
+    - samples: The number of samples, e.g. the number of frames.
+    - resolution: The number of points per segment the length of the spline is measured with.
+
+    Returns:
+    - (samples, 3) array of points along the spline, from the first to the last control point.
+    """
+    segments = catmull_rom_segments(control_points)
+    t = np.linspace(0, 1, resolution, endpoint=False)
+    basis = np.stack(((1 - t)**3, 3 * (1 - t)**2 * t, 3 * (1 - t) * t**2, t**3), axis=1)
+    dense = np.einsum('tk,skc->stc', basis, segments).reshape(-1, 3)
+    dense = np.concatenate((dense, segments[-1:, 3]))
+
+    lengths = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(dense, axis=0), axis=1))))
+    distances = np.linspace(0, lengths[-1], samples)
+
+    return np.column_stack([np.interp(distances, lengths, dense[:, axis]) for axis in range(3)])
+
+def smooth_path(points: np.ndarray, window: int) -> np.ndarray:
+    """
+    Smooths a sampled path with a moving average, the ends are held in place.
+
+    Parameters:
+    - points: (N, 3) array of points.
+    - window: The number of samples averaged, 1 or less leaves the path as it is.
+
+    Returns:
+    - (N, 3) array of smoothed points.
+    """
+    if window <= 1:
+        return np.array(points, dtype=float)
+
+    half = window // 2
+    padded = np.pad(np.asarray(points, dtype=float), ((half, half), (0, 0)), mode='edge')
+    kernel = np.ones(2 * half + 1) / (2 * half + 1)
+
+    return np.column_stack([np.convolve(padded[:, axis], kernel, mode='valid') for axis in range(3)])
+
+def terrain_clearance(points: np.ndarray, heightmap: np.ndarray, clearance: float, smoothing: int = 1) -> np.ndarray:
+    """
+    Lifts a sampled path to stay at least clearance above the terrain, the heights of the lifted path are
+    smoothed so it doesn't follow every bump, and lifted again where the smoothing lowered them.
+
+    Parameters:
+    - points: (N, 3) array of points.
+    - heightmap: The terrain array, see terrain.sample_heightmap.
+    - clearance: The smallest height above the terrain.
+    - smoothing: The moving average window of smooth_path.
+
+    Returns:
+    - (N, 3) array of points.
+    """
+    points = np.array(points, dtype=float)
+    ground = sample_heightmap(heightmap, points[:, 0], points[:, 1]) + clearance
+    points[:, 2] = np.maximum(points[:, 2], ground)
+    points[:, 2] = np.maximum(smooth_path(points, smoothing)[:, 2], ground)
+
+    return points
+
+def curve_points(curve_obj: bpy.types.Object, resolution: int = 12) -> np.ndarray:
+    """
+    Samples the points of a Bezier curve object in world space.
+
+    Parameters:
+    - curve_obj: The curve object.
+    - resolution: The number of samples per curve segment.
+
+    Returns:
+    - (N, 3) array of points along the curve.
+    """
+    points = []
+    for spline in curve_obj.data.splines:
+        bezier_points = spline.bezier_points
+        for start, end in zip(bezier_points[:-1], bezier_points[1:]):
+            points += interpolate_bezier(start.co, start.handle_right, end.handle_left, end.co, resolution)
+
+    return np.array([tuple(curve_obj.matrix_world @ point) for point in points])
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+import bpy
+from utils import peak_rss_mb
+
+# bpy.data collections counted after every stage
+counted_datablocks: tuple[str, ...] = ("objects", "meshes", "materials", "images", "node_groups", "curves")
+
+def current_rss_mb() -> float:
+    '''
+    Returns the current resident memory of this process in megabytes, or None where /proc is not available.
+    '''
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except OSError:
+        return None
+
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+def datablock_counts() -> dict[str, int]:
+    '''
+    Returns the number of datablocks of every counted bpy.data collection.
+    '''
+    return {name: len(getattr(bpy.data, name)) for name in counted_datablocks}
+
+class SceneProfiler:
+    '''
+    Records the wall time, memory and datablock counts of the stages of a scene build,
+    and optionally collects a cProfile of all stages.
+    '''
+
+    def __init__(self, cprofile: bool = False):
+        '''
+        Parameters:
+        - cprofile: Whether to run cProfile during the stages.
+        '''
+        self.stages: list[dict] = []
+        self.profiler = cProfile.Profile() if cprofile else None
+
+    @contextmanager
+    def stage(self, name: str):
+        '''
+        Measures the code in the with block as one stage.
+
+        Parameters:
+        - name: The name of the stage.
+        '''
+        if self.profiler is not None:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+            self.stages.append({
+                "stage": name,
+                "seconds": seconds,
+                "rss_mb": current_rss_mb(),
+                "peak_rss_mb": peak_rss_mb(),
+                "datablocks": datablock_counts(),
+            })
+
+    def summary(self) -> str:
+        '''
+        Returns a table of the stages, slowest stage marked.
+        '''
+        total = sum(stage["seconds"] for stage in self.stages)
+        slowest = max(self.stages, key=lambda stage: stage["seconds"])["stage"] if self.stages else None
+
+        lines = [f"{'stage':<24}{'seconds':>10}{'share':>8}{'peak MB':>10}{'objects':>9}"]
+        for stage in self.stages:
+            share = stage["seconds"] / total if total else 0.0
+            marker = " *" if stage["stage"] == slowest else ""
+            peak = "-" if stage["peak_rss_mb"] is None else f"{stage['peak_rss_mb']:.1f}"
+            lines.append(f"{stage['stage']:<24}{stage['seconds']:>10.3f}{share:>8.1%}"
+                         f"{peak:>10}{stage['datablocks']['objects']:>9}{marker}")
+        lines.append(f"{'total':<24}{total:>10.3f}")
+
+        return "\n".join(lines)
+
+    def record(self, **extra) -> dict:
+        '''
+        Returns the JSON record of the scene: the stages plus any extra fields.
+        '''
+        return {**extra, "total_seconds": sum(stage["seconds"] for stage in self.stages), "stages": self.stages}
+
+    def write_record(self, path: str, **extra):
+        '''
+        Appends the JSON record of the scene as one line to a file.
+
+        Parameters:
+        - path: The JSON lines file.
+        - extra: Extra fields of the record, e.g. the scene parameters.
+        '''
+        with open(path, "a") as stats_file:
+            stats_file.write(json.dumps(self.record(**extra), default=str) + "\n")
+
+    def dump_profile(self, path: str):
+        '''
+        Writes the collected cProfile stats, readable with pstats or snakeviz.
+
+        Parameters:
+        - path: The stats file.
+        '''
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
@@ -0,0 +1,51 @@
+import zlib
+import numpy as np
+
+'''
+Independent random streams for the stages of a scene build, all derived from one root seed.
+every stage gets its own NumPy generator keyed by the root seed and the stage name, so a stage
+draws the same numbers whether it runs first, last, in another process or is fetched from a cache.
+'''
+
+# the stages of a scene build that draw random numbers
+scene_stages: tuple[str, ...] = ("terrain", "curve", "trees", "fire")
+
+def stage_seed_sequence(root_seed: int, stage: str) -> np.random.SeedSequence:
+    '''
+    Returns the seed sequence of a stage.
+
+    Parameters:
+    - root_seed: The seed of the scene.
+    - stage: The name of the stage, e.g. one of scene_stages.
+
+    Returns:
+    - The seed sequence of the stage.
+    '''
+    return np.random.SeedSequence([root_seed % 2**64, zlib.crc32(stage.encode())])
+
+def stage_rng(root_seed: int, stage: str) -> np.random.Generator:
+    '''
+    Returns a new random generator for a stage, the same root seed and stage always give the same numbers.
+
+    Parameters:
+    - root_seed: The seed of the scene.
+    - stage: The name of the stage, e.g. one of scene_stages.
+
+    Returns:
+    - The random generator of the stage.
+    '''
+    return np.random.default_rng(stage_seed_sequence(root_seed, stage))
+
+def stage_seed(root_seed: int, stage: str) -> int:
+    '''
+    Returns an integer seed for a stage whose code takes a seed instead of a generator,
+    e.g. the terrain noise or a geometry nodes seed. the seed is positive and fits in 31 bits.
+
+    Parameters:
+    - root_seed: The seed of the scene.
+    - stage: The name of the stage, e.g. one of scene_stages.
+
+    Returns:
+    - The seed of the stage.
+    '''
+    return int(stage_seed_sequence(root_seed, stage).generate_state(1)[0] % (2**31 - 1)) + 1
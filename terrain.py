@@ -1,27 +1,121 @@
-from perlin_noise import PerlinNoise
+import os
+import json
+import random
+import hashlib
 import numpy as np
 import bpy
+from utils import atomic_write, evict_cache
 
-def generate_noise(xpix: int, ypix: int, octave: int, seed: int) -> np.ndarray:
+# bump whenever generate_terrain output changes, so cached heightmaps of older versions are not reused
+NOISE_VERSION = 1
+
+def _fade(t: np.ndarray) -> np.ndarray:
+    '''
+    Perlin's quintic smoothstep 6t^5 - 15t^4 + 10t^3.
+    '''
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+def _lattice_gradients(xcells: int, ycells: int, seed: int) -> np.ndarray:
+    '''
+    Random gradient vectors on the integer lattice, seeded the same way as perlin_noise.PerlinNoise.
+
+    Parameters:
+        - xcells (int): Number of lattice points along the first axis.
+        - ycells (int): Number of lattice points along the second axis.
+        - seed (int): Seed of the noise.
+
+    Returns:
+        - gradients (np.ndarray): (xcells, ycells, 2) array of gradient vectors.
+    '''
+
+    gradients = np.empty((xcells, ycells, 2))
+    for cx in range(xcells):
+        for cy in range(ycells):
+            rng = random.Random(seed * max(1, abs(cx + 10 * cy + 1)))
+            gradients[cx, cy] = rng.uniform(-1, 1), rng.uniform(-1, 1)
+
+    return gradients
+
+def generate_noise(xpix: int, ypix: int, octave: int, seed: int, rows: tuple[int, int] = None) -> np.ndarray:
     '''
     Generate a 2D Perlin noise array with given dimensions and parameters.
+    the whole grid is evaluated at once with NumPy, the values match perlin_noise.PerlinNoise for the same seed.
 
     Parameters:
         - xpix (int): Width of the noise array.
         - ypix (int): Height of the noise array.
         - octave (int): Number of octaves for the Perlin noise.
-        - seed (int): Seed for the Perlin noise.
+        - seed (int): Seed for the Perlin noise, 0 draws a random seed like PerlinNoise does.
+        - rows (tuple[int, int]): Only evaluate the rows in [start, stop) of the array, None for all rows.
 
     Returns:
         - noise (np.ndarray): 2D Perlin noise array.
     '''
 
-    noise = PerlinNoise(octaves=octave, seed=seed)
-    noise = [[noise([i/xpix, j/ypix]) for j in range(xpix)] for i in range(ypix)]
-    noise = np.array(noise)
+    if not seed:
+        seed = random.randint(1, 10**5)
+
+    # sample coordinates, row i is at i/xpix and column j at j/ypix
+    xs = np.arange(ypix) / xpix * octave
+    ys = np.arange(xpix) / ypix * octave
+    x0 = np.floor(xs).astype(np.int64)
+    y0 = np.floor(ys).astype(np.int64)
+    gradients = _lattice_gradients(int(x0.max()) + 2, int(y0.max()) + 2, seed)
+
+    if rows is not None:
+        xs, x0 = xs[rows[0]:rows[1]], x0[rows[0]:rows[1]]
+
+    noise = np.zeros((len(xs), xpix))
+    for ox in (0, 1):
+        distx = xs - (x0 + ox)
+        weightx = _fade(1 - np.abs(distx))
+        for oy in (0, 1):
+            disty = ys - (y0 + oy)
+            weighty = _fade(1 - np.abs(disty))
+            corner = np.ix_(x0 + ox, y0 + oy)
+            dot = gradients[..., 0][corner] * distx[:, None] + gradients[..., 1][corner] * disty[None, :]
+            noise += weightx[:, None] * weighty[None, :] * dot
 
     return noise
 
+def generate_terrain_tiled(xpix: int, ypix: int, height_variation: float, ruggedness: float, seed: int = 0,
+                          tile_rows: int = 256, out: np.ndarray = None) -> np.ndarray:
+    '''
+    Generate a 2D terrain array tile by tile, accumulating every noise layer of a tile before moving on.
+    peak memory is the output plus one tile, and the output can be a memory mapped array, e.g. from
+    np.lib.format.open_memmap, to keep even that out of RAM. the result equals generate_terrain.
+
+    Parameters:
+        - xpix (int): Width of the terrain array.
+        - ypix (int): Height of the terrain array.
+        - height_variation (float): Height variation of the terrain.
+        - ruggedness (float): Ruggedness of the terrain.
+        - seed (int): Seed for the Perlin noise.
+        - tile_rows (int): Number of rows generated at once.
+        - out (np.ndarray): (ypix, xpix) float64 array to write the terrain into, None allocates one.
+
+    Returns:
+        - terrain (np.ndarray): 2D terrain array.
+    '''
+
+    octaves: list[int] = [3, 6, 12, 24]
+    scales: list[float] = [height_variation, height_variation, ruggedness, ruggedness]
+
+    # seed 0 draws one random seed per layer, draw them once for all tiles
+    seeds: list[int] = [seed if seed else random.randint(1, 10**5) for _ in octaves]
+
+    if out is None:
+        out = np.zeros((ypix, xpix))
+    else:
+        out[...] = 0
+
+    for start in range(0, ypix, tile_rows):
+        stop = min(start + tile_rows, ypix)
+        for octave, scale, octave_seed in zip(octaves, scales, seeds):
+            out[start:stop] += generate_noise(xpix, ypix, octave, octave_seed, (start, stop)) * scale
+
+    return out
+
 def generate_terrain(xpix: int, ypix: int, height_variation: float,
                     ruggedness: float, seed: int = 0) -> np.ndarray:
     '''
@@ -39,101 +133,436 @@ def generate_terrain(xpix: int, ypix: int, height_variation: float,
         - terrain (np.ndarray): 2D terrain array.
     '''
 
-    octaves: list[int] = [3, 6, 12, 24]
-    scales: list[float] = [height_variation, height_variation, ruggedness, ruggedness]
+    return generate_terrain_tiled(xpix, ypix, height_variation, ruggedness, seed)
 
-    terrains: list[np.ndarray] = [generate_noise(xpix, ypix, octave, seed) for octave in octaves]
-    terrain = np.array(sum(terrain * scale for terrain, scale in zip(terrains, scales)))
+def terrain_cache_key(xpix: int, ypix: int, height_variation: float, ruggedness: float, seed: int) -> str:
+    '''
+    Returns the cache key of a terrain: a hash of its parameters and NOISE_VERSION.
+    '''
 
-    return terrain
+    params = [NOISE_VERSION, xpix, ypix, float(height_variation), float(ruggedness), seed]
 
-def array_to_mesh(terrain: np.ndarray) -> bpy.types.Object:
+    return hashlib.sha256(json.dumps(params).encode()).hexdigest()[:32]
+
+def cached_generate_terrain(xpix: int, ypix: int, height_variation: float, ruggedness: float, seed: int = 0,
+                            cache_dir: str = os.path.join("cache", "terrain"),
+                            max_bytes: int = 2 * 1024**3) -> np.ndarray:
     '''
-    Converts a 2D terrain array to a Blender mesh object.
+    Same as generate_terrain, with the result cached on disk as a .npy file.
+    cached terrains are memory mapped read-only, and the least recently used ones are evicted
+    above max_bytes. seed 0 draws random noise seeds, so those terrains are never cached.
 
     Parameters:
+        - xpix (int): Width of the terrain array.
+        - ypix (int): Height of the terrain array.
+        - height_variation (float): Height variation of the terrain.
+        - ruggedness (float): Ruggedness of the terrain.
+        - seed (int): Seed for the Perlin noise.
+        - cache_dir (str): Directory of the cached terrains.
+        - max_bytes (int): Size limit of the cache directory, None for no limit.
+
+    Returns:
         - terrain (np.ndarray): 2D terrain array.
+    '''
+
+    if not seed:
+        return generate_terrain(xpix, ypix, height_variation, ruggedness, seed)
+
+    path = os.path.join(cache_dir, terrain_cache_key(xpix, ypix, height_variation, ruggedness, seed) + ".npy")
+    if os.path.exists(path):
+        os.utime(path)
+        return np.load(path, mmap_mode='r')
+
+    # generate straight into the cache file
+    def write(part_path: str):
+        terrain = np.lib.format.open_memmap(part_path, mode='w+', dtype=np.float64, shape=(ypix, xpix))
+        generate_terrain_tiled(xpix, ypix, height_variation, ruggedness, seed, out=terrain)
+        terrain.flush()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    atomic_write(path, write)
+    evict_cache(cache_dir, max_bytes, keep=(path,))
+
+    return np.load(path, mmap_mode='r')
+
+def sample_heightmap(terrain: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    '''
+    Bilinearly interpolates a terrain array at many points at once.
+    the terrain vertex (r, c) is at x = r, y = c, like in array_to_mesh.
+
+    Parameters:
+        - terrain (np.ndarray): 2D terrain array.
+        - xs (np.ndarray): x coordinates of the points.
+        - ys (np.ndarray): y coordinates of the points.
+
+    Returns:
+        - heights (np.ndarray): terrain height at every point.
+    '''
+
+    rows, cols = terrain.shape
+    xs = np.clip(xs, 0, rows - 1)
+    ys = np.clip(ys, 0, cols - 1)
+    x0 = np.minimum(np.floor(xs).astype(np.int64), max(rows - 2, 0))
+    y0 = np.minimum(np.floor(ys).astype(np.int64), max(cols - 2, 0))
+    x1 = np.minimum(x0 + 1, rows - 1)
+    y1 = np.minimum(y0 + 1, cols - 1)
+    tx = xs - x0
+    ty = ys - y0
+
+    top = terrain[x0, y0] * (1 - ty) + terrain[x0, y1] * ty
+    bottom = terrain[x1, y0] * (1 - ty) + terrain[x1, y1] * ty
+
+    return top * (1 - tx) + bottom * tx
+
+def terrain_slope(terrain: np.ndarray) -> np.ndarray:
+    '''
+    Computes the slope of a terrain array in degrees from its gradient.
+
+    Parameters:
+        - terrain (np.ndarray): 2D terrain array.
+
+    Returns:
+        - slope (np.ndarray): 2D array of slopes in degrees.
+    '''
+
+    dx, dy = np.gradient(terrain)
+
+    return np.degrees(np.arctan(np.hypot(dx, dy)))
+
+def _mesh_from_arrays(co: np.ndarray, quads: np.ndarray, uv: np.ndarray) -> bpy.types.Object:
+    '''
+    Builds a terrain mesh object from flat NumPy buffers with foreach_set.
+
+    Parameters:
+        - co (np.ndarray): (N, 3) vertex coordinates.
+        - quads (np.ndarray): (M, 4) vertex indices of the quads.
+        - uv (np.ndarray): (N, 2) UV coordinates of the vertices.
 
     Returns:
         - obj (bpy.types.Object): Blender mesh object.
     '''
 
+    loops = np.ascontiguousarray(quads, dtype=np.int32).ravel()
+
     mesh = bpy.data.meshes.new("terrain_mesh")
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(co, dtype=np.float32).ravel())
+    mesh.loops.add(loops.size)
+    mesh.loops.foreach_set("vertex_index", loops)
+    mesh.polygons.add(loops.size // 4)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, loops.size, 4, dtype=np.int32))
 
-    verts = [(x, y, hight) for (x,y), hight in np.ndenumerate(terrain)]
-    edges = []
-    faces = [(y * terrain.shape[1] + x, y * terrain.shape[1] + (x + 1),
-            (y + 1) * terrain.shape[1] + (x + 1), (y + 1) * terrain.shape[1] + x)
-            for x,y in np.ndindex(terrain.shape[0] - 1, terrain.shape[1] - 1)]
+    # one UV per loop
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    uv_layer.data.foreach_set("uv", np.ascontiguousarray(uv, dtype=np.float32)[loops].ravel())
 
-    mesh.from_pydata(verts, edges, faces)
-    mesh.update()
+    mesh.update(calc_edges=True)
 
     obj = bpy.data.objects.new("Terrain", mesh)
     bpy.context.collection.objects.link(obj)
 
     return obj
 
-def apply_texture(mesh: bpy.types.Object, path: str) -> bpy.types.Object:
+def array_to_mesh(terrain: np.ndarray) -> bpy.types.Object:
+    '''
+    Converts a 2D terrain array to a Blender mesh object.
+    vertices, quads and UVs are built as flat NumPy buffers and loaded with foreach_set,
+    so no per-vertex Python tuples are allocated.
+
+    Parameters:
+        - terrain (np.ndarray): 2D terrain array.
+
+    Returns:
+        - obj (bpy.types.Object): Blender mesh object.
+    '''
+
+    rows, cols = terrain.shape
+
+    # vertex (r, c) is at (r, c, terrain[r, c]) with index r * cols + c
+    co = np.empty((rows, cols, 3), dtype=np.float32)
+    co[..., 0] = np.arange(rows, dtype=np.float32)[:, None]
+    co[..., 1] = np.arange(cols, dtype=np.float32)[None, :]
+    co[..., 2] = terrain
+
+    index = np.arange(rows * cols, dtype=np.int32).reshape(rows, cols)
+    quads = np.empty((rows - 1, cols - 1, 4), dtype=np.int32)
+    quads[..., 0] = index[:-1, :-1]
+    quads[..., 1] = index[:-1, 1:]
+    quads[..., 2] = index[1:, 1:]
+    quads[..., 3] = index[1:, :-1]
+
+    # UVs span [0, 1] over the terrain
+    uv = np.empty((rows, cols, 2), dtype=np.float32)
+    uv[..., 0] = np.linspace(0, 1, rows, dtype=np.float32)[:, None]
+    uv[..., 1] = np.linspace(0, 1, cols, dtype=np.float32)[None, :]
+
+    return _mesh_from_arrays(co.reshape(-1, 3), quads.reshape(-1, 4), uv.reshape(-1, 2))
+
+def _tile_samples(start: int, end: int, step: int) -> np.ndarray:
+    '''
+    Grid lines of a tile spanning [start, end] at the given step, the tile borders always included.
+    '''
+    return np.unique(np.append(np.arange(start, end, step), end))
+
+def lod_steps(shape: tuple[int, int], tile_size: int, path_points: np.ndarray,
+              lod_distances: tuple[float, ...]) -> np.ndarray:
+    '''
+    Chooses the sampling step of every terrain tile from its distance to the camera path.
+    tiles nearer than lod_distances[0] keep every cell, every further threshold doubles the step.
+
+    Parameters:
+        - shape (tuple[int, int]): Shape of the terrain array.
+        - tile_size (int): Number of cells along a tile side.
+        - path_points (np.ndarray): (N, 2) or (N, 3) points along the camera path.
+        - lod_distances (tuple[float, ...]): Increasing distances at which the step doubles.
+
+    Returns:
+        - steps (np.ndarray): 2D array of the step of every tile, powers of two.
+    '''
+
+    rows, cols = shape
+    row_starts = np.arange(0, rows - 1, tile_size)
+    col_starts = np.arange(0, cols - 1, tile_size)
+    centers_x = (row_starts + np.minimum(row_starts + tile_size, rows - 1)) / 2
+    centers_y = (col_starts + np.minimum(col_starts + tile_size, cols - 1)) / 2
+
+    points = np.asarray(path_points, dtype=float)[:, :2]
+    dx = centers_x[:, None, None] - points[None, None, :, 0]
+    dy = centers_y[None, :, None] - points[None, None, :, 1]
+    distance = np.hypot(dx, dy).min(axis=-1)
+
+    return 2 ** np.searchsorted(np.asarray(lod_distances), distance, side='right')
+
+def array_to_mesh_lod(terrain: np.ndarray, path_points: np.ndarray, tile_size: int = 32,
+                      lod_distances: tuple[float, ...] = (40, 80, 160)) -> bpy.types.Object:
+    '''
+    Converts a 2D terrain array to a Blender mesh with coarser tiles far from the camera path.
+    where a tile meets a coarser neighbour, its border vertices between the neighbour's samples are
+    moved onto the neighbour's border line, so the tiles meet without cracks.
+    trees are still placed on the full resolution heightmap, far tiles may be off by the coarse error.
+
+    Parameters:
+        - terrain (np.ndarray): 2D terrain array.
+        - path_points (np.ndarray): (N, 2) or (N, 3) points along the camera path.
+        - tile_size (int): Number of cells along a tile side.
+        - lod_distances (tuple[float, ...]): Increasing distances at which the tile step doubles.
+
+    Returns:
+        - obj (bpy.types.Object): Blender mesh object.
+    '''
+
+    rows, cols = terrain.shape
+    steps = lod_steps(terrain.shape, tile_size, path_points, lod_distances)
+    tiles_r, tiles_c = steps.shape
+
+    ids, heights, quads = [], [], []
+    offset = 0
+    for tr in range(tiles_r):
+        r0, r1 = tr * tile_size, min((tr + 1) * tile_size, rows - 1)
+        for tc in range(tiles_c):
+            c0, c1 = tc * tile_size, min((tc + 1) * tile_size, cols - 1)
+            step = steps[tr, tc]
+            rs = _tile_samples(r0, r1, step)
+            cs = _tile_samples(c0, c1, step)
+            z = terrain[np.ix_(rs, cs)].astype(np.float64)
+
+            # snap border vertices onto the border line of coarser neighbours
+            if tr > 0 and steps[tr - 1, tc] > step:
+                coarse = _tile_samples(c0, c1, steps[tr - 1, tc])
+                z[0] = np.interp(cs, coarse, terrain[r0, coarse])
+            if tr < tiles_r - 1 and steps[tr + 1, tc] > step:
+                coarse = _tile_samples(c0, c1, steps[tr + 1, tc])
+                z[-1] = np.interp(cs, coarse, terrain[r1, coarse])
+            if tc > 0 and steps[tr, tc - 1] > step:
+                coarse = _tile_samples(r0, r1, steps[tr, tc - 1])
+                z[:, 0] = np.interp(rs, coarse, terrain[coarse, c0])
+            if tc < tiles_c - 1 and steps[tr, tc + 1] > step:
+                coarse = _tile_samples(r0, r1, steps[tr, tc + 1])
+                z[:, -1] = np.interp(rs, coarse, terrain[coarse, c1])
+
+            local = offset + np.arange(rs.size * cs.size).reshape(rs.size, cs.size)
+            tile_quads = np.stack((local[:-1, :-1], local[:-1, 1:], local[1:, 1:], local[1:, :-1]), axis=-1)
+            ids.append((rs[:, None] * cols + cs[None, :]).ravel())
+            heights.append(z.ravel())
+            quads.append(tile_quads.reshape(-1, 4))
+            offset += rs.size * cs.size
+
+    # vertices on shared tile borders appear in both tiles with the same height, keep one of them
+    ids = np.concatenate(ids)
+    heights = np.concatenate(heights)
+    unique_ids, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    quads = inverse[np.concatenate(quads)]
+
+    vertex_rows, vertex_cols = np.divmod(unique_ids, cols)
+    co = np.column_stack((vertex_rows, vertex_cols, heights[first]))
+    uv = np.column_stack((vertex_rows / (rows - 1), vertex_cols / (cols - 1)))
+
+    return _mesh_from_arrays(co, quads, uv)
+
+def mip_size(resolution: tuple[int, int], oversample: float = 2.0) -> int:
+    '''
+    Returns the texture size matching a render resolution: the smallest power of two
+    at least oversample times the larger side of the render.
+    '''
+
+    return int(2 ** np.ceil(np.log2(max(resolution) * oversample)))
+
+def load_image(path: str, max_size: int = None, cache_dir: str = os.path.join("cache", "textures")) -> bpy.types.Image:
+    '''
+    Loads an image, reusing it if it is already loaded in the session.
+    with max_size, an image larger than max_size is downscaled once to a PNG in cache_dir,
+    and the downscaled version is used instead of the full resolution one.
+
+    Parameters:
+        path (str): The path to the image file.
+        max_size (int): The largest allowed side in pixels, None keeps the full resolution.
+        cache_dir (str): Directory of the downscaled images.
+
+    Returns:
+        bpy.types.Image: The image.
+    '''
+
+    if max_size is None:
+        return bpy.data.images.load(path, check_existing=True)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    path_hash = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:8]
+    mip_path = os.path.join(cache_dir, f"{name}_{path_hash}_{max_size}.png")
+    if os.path.exists(mip_path):
+        return bpy.data.images.load(mip_path, check_existing=True)
+
+    image = bpy.data.images.load(path, check_existing=True)
+    width, height = image.size
+    if max(width, height) <= max_size:
+        return image
+
+    scale = max_size / max(width, height)
+    mip = image.copy()
+    mip.scale(max(1, round(width * scale)), max(1, round(height * scale)))
+    if image.users == 0:
+        bpy.data.images.remove(image)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    mip.file_format = 'PNG'
+    atomic_write(mip_path, lambda part_path: mip.save(filepath=part_path))
+    bpy.data.images.remove(mip)
+
+    return bpy.data.images.load(mip_path, check_existing=True)
+
+def apply_texture(mesh: bpy.types.Object, path: str, max_size: int = None) -> bpy.types.Object:
     '''
     Applies an image to a Blender mesh object.
+    the material of an image is created once and reused by later terrains, it keeps a fake user
+    so it also survives between scenes of a persistent worker, save_scene_to_file leaves it out of
+    scenes that don't use it.
 
     Parameters:
         mesh (bpy.types.Object): The Blender mesh object to apply the texture to.
         path (str): The path to the image file to use as the texture.
+        max_size (int): The largest texture side in pixels, see load_image. None keeps the full resolution.
 
     Returns:
         bpy.types.Object: The mesh object with the texture applied.
 
     '''
 
-    # init a clean material
-    material = bpy.data.materials.new(name="TerrainMaterial")
-    material.use_nodes = True
-    material.node_tree.nodes.clear()
-    nodes = material.node_tree.nodes
-    links = material.node_tree.links
+    path_hash = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:8]
+    material_name = f"TerrainMaterial_{path_hash}_{max_size or 'full'}"
+    material = bpy.data.materials.get(material_name)
+    if material is None:
+        # init a clean material
+        material = bpy.data.materials.new(name=material_name)
+        material.use_fake_user = True
+        material.use_nodes = True
+        material.node_tree.nodes.clear()
+        nodes = material.node_tree.nodes
+        links = material.node_tree.links
+
+        # Add texture nodes
+        texture_coordinate = nodes.new('ShaderNodeTexCoord')
+        image_texture = nodes.new('ShaderNodeTexImage')
+        principled_bsdf = nodes.new('ShaderNodeBsdfPrincipled')
+        material_output = nodes.new('ShaderNodeOutputMaterial')
+
+        # Set node properties
+        image_texture.image = load_image(path, max_size)
+
+        # link the texture nodes
+        links.new(texture_coordinate.outputs[0], image_texture.inputs[0])
+        links.new(image_texture.outputs[0], principled_bsdf.inputs[0])
+        links.new(principled_bsdf.outputs[0], material_output.inputs[0])
 
-    # Add texture nodes
-    texture_coordinate = nodes.new('ShaderNodeTexCoord')
-    image_texture = nodes.new('ShaderNodeTexImage')
-    principled_bsdf = nodes.new('ShaderNodeBsdfPrincipled')
-    material_output = nodes.new('ShaderNodeOutputMaterial')
+    # Assign and activate material on mesh
+    mesh.data.materials.append(material)
 
-    # Set node properties
-    image_texture.image = bpy.data.images.load(path)
+    return mesh
 
-    # link the texture nodes
-    links.new(texture_coordinate.outputs[0], image_texture.inputs[0])
-    links.new(image_texture.outputs[0], principled_bsdf.inputs[0])
-    links.new(principled_bsdf.outputs[0], material_output.inputs[0])
+def apply_linked_material(mesh: bpy.types.Object, blend_path: str, material_name: str = None) -> bpy.types.Object:
+    '''
+    Applies a material of a .blend file to a Blender mesh object, linked from the file as a library,
+    so saved scenes reference the material and its textures instead of containing copies.
 
-    # Assign and activate material on mesh
-    mesh.data.materials.append(material)
+    Parameters:
+        mesh (bpy.types.Object): The Blender mesh object to apply the material to.
+        blend_path (str): The path to the .blend file with the material, e.g. a file under textures/.
+        material_name (str): The name of the material, None takes the material of a file with a single material.
+
+    Returns:
+        bpy.types.Object: The mesh object with the material applied.
+
+    '''
+
+    with bpy.data.libraries.load(blend_path, link=True) as (data_from, data_to):
+        names = list(data_from.materials)
+        if material_name is None and len(names) == 1:
+            material_name = names[0]
+        if material_name not in names:
+            raise ValueError(f"{blend_path} has no material {material_name}, pick one of {names}")
+        data_to.materials = [material_name]
+    mesh.data.materials.append(data_to.materials[0])
 
     return mesh
 
 def generate_blender_terrain(path: str, xpix: int, ypix: int, height_variation: float,
-    ruggedness: float, seed: int = 0):
+    ruggedness: float, seed: int = 0, lod_path_points: np.ndarray = None, lod_tile_size: int = 32,
+    lod_distances: tuple[float, ...] = (40, 80, 160), cache_dir: str = os.path.join("cache", "terrain"),
+    cache_max_bytes: int = 2 * 1024**3, texture_size: int = None, material_name: str = None):
     '''
     Generates a Blender mesh object with a terrain texture applied.
     the terrain is generated using perlin noise.
 
     Parameters:
-        path (str): The path to the image file to use as the texture.
+        path (str): The path to the image file to use as the texture, or to a .blend file to link the material from.
         xpix (int): The number of pixels in the x direction.
         ypix (int): The number of pixels in the y direction.
         height_variation (float): The height variation of the terrain.
         ruggedness (float): The ruggedness of the terrain.
         seed (int): The seed for the random number generator.
+        lod_path_points (np.ndarray): Points along the camera path, builds a level of detail mesh when given.
+        lod_tile_size (int): Number of cells along a level of detail tile side.
+        lod_distances (tuple[float, ...]): Distances from the camera path at which the tile step doubles.
+        cache_dir (str): Directory of the heightmap cache, None disables the cache.
+        cache_max_bytes (int): Size limit of the heightmap cache.
+        texture_size (int): The largest texture side in pixels, None keeps the full resolution.
+        material_name (str): The material to link when path is a .blend file, see apply_linked_material.
 
     Returns:
         bpy.types.Object: The mesh object with the texture applied.
+        np.ndarray: The terrain array the mesh was built from.
 
     '''
 
-    terrain = generate_terrain(xpix, ypix, height_variation, ruggedness, seed)
-    mesh = array_to_mesh(terrain)
-    mesh = apply_texture(mesh, path)
-
-    return mesh
+    if cache_dir is None:
+        terrain = generate_terrain(xpix, ypix, height_variation, ruggedness, seed)
+    else:
+        terrain = cached_generate_terrain(xpix, ypix, height_variation, ruggedness, seed, cache_dir, cache_max_bytes)
+    if lod_path_points is None:
+        mesh = array_to_mesh(terrain)
+    else:
+        mesh = array_to_mesh_lod(terrain, lod_path_points, lod_tile_size, lod_distances)
+    if path.endswith(".blend"):
+        mesh = apply_linked_material(mesh, path, material_name)
+    else:
+        mesh = apply_texture(mesh, path, texture_size)
+
+    return mesh, terrain
@@ -0,0 +1,11 @@
+import os
+import sys
+import importlib.util
+from unittest.mock import MagicMock
+
+# the scripts are top level modules of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# outside blender bpy is not importable, the tested code only needs it at import time
+if importlib.util.find_spec("bpy") is None:
+    sys.modules["bpy"] = MagicMock()
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from terrain import generate_noise, generate_terrain, generate_terrain_tiled
+
+def reference_noise(xpix: int, ypix: int, octave: int, seed: int) -> np.ndarray:
+    '''
+    The noise of the original per-pixel implementation with perlin_noise.PerlinNoise.
+    '''
+    perlin_noise = pytest.importorskip("perlin_noise")
+    noise = perlin_noise.PerlinNoise(octaves=octave, seed=seed)
+
+    return np.array([[noise([i / xpix, j / ypix]) for j in range(xpix)] for i in range(ypix)])
+
+def test_noise_statistics():
+    noise = generate_noise(48, 40, 6, 42)
+
+    assert noise.shape == (40, 48)
+    np.testing.assert_allclose([noise.mean(), noise.std(), noise.min(), noise.max()],
+                               [0.01870080571043363, 0.18439907041736356, -0.5000864948348895, 0.5783022422777799],
+                               rtol=1e-12)
+    np.testing.assert_allclose([noise[5, 7], noise[31, 2]], [0.04570710685919201, 0.17609850462585488], rtol=1e-12)
+
+def test_terrain_statistics():
+    terrain = generate_terrain(64, 64, 5.0, 0.5, 7)
+
+    np.testing.assert_allclose([terrain.mean(), terrain.std(), terrain.min(), terrain.max()],
+                               [0.1353428369142137, 1.4113535966117525, -3.6953532693743387, 3.9680096329896113],
+                               rtol=1e-12)
+
+@pytest.mark.parametrize("xpix, ypix, octave, seed", [(20, 20, 3, 1), (24, 16, 6, 42), (16, 24, 12, 7)])
+def test_noise_matches_perlin_noise(xpix, ypix, octave, seed):
+    np.testing.assert_allclose(generate_noise(xpix, ypix, octave, seed), reference_noise(xpix, ypix, octave, seed),
+                               rtol=0, atol=1e-12)
+
+def test_tiled_terrain_matches_whole_terrain():
+    whole = sum(generate_noise(30, 50, octave, 3) * scale for octave, scale in zip([3, 6, 12, 24], [2.0, 2.0, 0.5, 0.5]))
+
+    np.testing.assert_allclose(generate_terrain_tiled(30, 50, 2.0, 0.5, 3, tile_rows=7), whole, rtol=0, atol=1e-12)
@@ -0,0 +1,42 @@
+import os
+import time
+import pytest
+
+from utils import atomic_write, evict_cache
+
+def test_atomic_write_renames_complete_result(tmp_path):
+    path = tmp_path / "entry.npy"
+    atomic_write(str(path), lambda part_path: open(part_path, "w").write("done"))
+
+    assert path.read_text() == "done"
+    assert os.listdir(tmp_path) == ["entry.npy"]
+
+def test_atomic_write_removes_partial_result(tmp_path):
+    def failing_bake(part_path: str):
+        os.makedirs(os.path.join(part_path, "data"))
+        raise RuntimeError("bake cancelled")
+
+    with pytest.raises(RuntimeError):
+        atomic_write(str(tmp_path / "bake"), failing_bake)
+
+    assert os.listdir(tmp_path) == []
+
+def test_evict_cache_removes_abandoned_partial_entries(tmp_path):
+    old, fresh = tmp_path / "old.123.part", tmp_path / "fresh.456.part"
+    for part in (old, fresh):
+        part.mkdir()
+        (part / "data").write_bytes(b"x" * 100)
+    day_ago = time.time() - 2 * 24 * 3600
+    for path in (old / "data", old):
+        os.utime(path, (day_ago, day_ago))
+
+    evicted = evict_cache(str(tmp_path), max_bytes=1000)
+
+    assert evicted == [str(old)]
+    assert os.listdir(tmp_path) == ["fresh.456.part"]
+
+def test_evict_cache_counts_partial_entries(tmp_path):
+    (tmp_path / "entry").write_bytes(b"x" * 100)
+    (tmp_path / "entry.123.part").write_bytes(b"x" * 100)
+
+    assert evict_cache(str(tmp_path), max_bytes=150) == [str(tmp_path / "entry")]
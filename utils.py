@@ -1,5 +1,19 @@
 import bpy
 import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+from typing import Callable
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
 
 def remove_file(file_name: str) -> None:
     '''
@@ -12,16 +26,248 @@ def remove_file(file_name: str) -> None:
     if os.path.exists(file_name):
         os.remove(file_name)
 
-def save_scene_to_file(file_name: str) -> None:
+def remove_entry(path: str) -> None:
+    '''
+    Removes a file or a directory tree if it exists.
+    '''
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        remove_file(path)
+
+def directory_size(path: str) -> int:
+    '''
+    Returns the total size in bytes of the files under a directory, or of a single file.
+    '''
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+def atomic_write(path: str, write: Callable[[str], None]) -> None:
+    '''
+    Writes a file or directory under a temporary name next to it and renames it into place when complete,
+    so concurrent workers never read a partial result. when write raises, the partial result is removed.
+    a directory another worker renamed into place first is kept and this worker's copy is discarded.
+
+    Args:
+        path (str): The path of the finished file or directory.
+        write (Callable[[str], None]): Writes the file or directory to the temporary path it is given.
+    '''
+    part_path = f"{path}.{os.getpid()}.part"
+    try:
+        write(part_path)
+    except BaseException:
+        remove_entry(part_path)
+        raise
+    try:
+        os.replace(part_path, path)
+    except OSError:
+        if not os.path.isdir(part_path):
+            raise
+        remove_entry(part_path)
+
+def last_modified(path: str) -> float:
+    '''
+    Returns the latest modification time of a file, or of a directory and the files under it.
+    '''
+    if os.path.isfile(path):
+        return os.path.getmtime(path)
+
+    return max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(root, name))
+                                            for root, _, names in os.walk(path) for name in names])
+
+def peak_rss_mb() -> float:
+    '''
+    Returns the peak resident memory of this process so far, in megabytes, or None where resource is not available.
+    '''
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes on linux
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+def evict_cache(cache_root: str, max_bytes: int = None, max_age_seconds: float = None,
+                keep: tuple[str, ...] = (), part_max_age_seconds: float = 24 * 3600) -> list[str]:
+    '''
+    Evicts entries (files or directories) of a cache directory, least recently used first.
+    an entry's last use is its modification time, cache hits should touch it with os.utime.
+    entries ending in .part are still being written and are not evicted, unless nothing under them changed
+    for part_max_age_seconds, then the process writing them is gone. the kept entries are never evicted either,
+    so the cache may stay above max_bytes when the kept and partial entries alone are larger.
+
+    Args:
+        cache_root (str): The cache directory.
+        max_bytes (int): The size the cache is reduced to, None for no size limit.
+        max_age_seconds (float): Entries unused for longer are evicted, None for no age limit.
+        keep (tuple[str, ...]): Paths of entries in use, e.g. the entry just written, which are never evicted.
+        part_max_age_seconds (float): Partial entries unchanged for longer are abandoned and evicted.
+
+    Returns:
+        list[str]: The paths of the evicted entries.
+    '''
+    if not os.path.isdir(cache_root):
+        return []
+
+    now = time.time()
+    kept = {os.path.abspath(path) for path in keep}
+    entries = []
+    parts = []
+    for name in os.listdir(cache_root):
+        entry = os.path.join(cache_root, name)
+        if os.path.abspath(entry) in kept:
+            continue
+        (parts if name.endswith(".part") else entries).append(entry)
+
+    abandoned = []
+    for part in parts:
+        try:
+            if now - last_modified(part) > part_max_age_seconds:
+                abandoned.append(part)
+        except FileNotFoundError:
+            # renamed into place since it was listed
+            pass
+
+    entries.sort(key=os.path.getmtime)
+    sizes = {entry: directory_size(entry) for entry in entries + abandoned}
+    total = (sum(sizes.values()) + sum(directory_size(path) for path in kept if os.path.exists(path))
+             + sum(directory_size(part) for part in parts if part not in abandoned))
+
+    evicted = []
+    for entry in abandoned + entries:
+        too_old = max_age_seconds is not None and now - os.path.getmtime(entry) > max_age_seconds
+        too_big = max_bytes is not None and total > max_bytes
+        if entry not in abandoned and not too_old and not too_big:
+            continue
+
+        remove_entry(entry)
+        total -= sizes[entry]
+        evicted.append(entry)
+
+    return evicted
+
+def shared_datablocks() -> tuple[list[bpy.types.Mesh], list[bpy.types.Material]]:
+    '''
+    Returns the local meshes of the scene objects and their materials, the terrain and vegetation data
+    that scenes built from the same parameters share. the fire domains and flows are scene specific and
+    left out, a burning tree still links its mesh when the other trees share it.
+    '''
+    meshes = {obj.data for obj in bpy.context.scene.objects
+              if obj.type == 'MESH' and obj.data.library is None and obj.modifiers.get("Fluid") is None}
+    materials = {material for mesh in meshes for material in mesh.materials
+                 if material is not None and material.library is None}
+
+    return sorted(meshes, key=lambda mesh: mesh.name), sorted(materials, key=lambda material: material.name)
+
+def shared_data_key(meshes: list[bpy.types.Mesh], materials: list[bpy.types.Material]) -> str:
+    '''
+    Hashes the content of shared datablocks: the mesh geometry and the material names and images.
+
+    Args:
+        meshes (list[bpy.types.Mesh]): The shared meshes.
+        materials (list[bpy.types.Material]): The shared materials.
+
+    Returns:
+        str: The key of the shared data.
+    '''
+    hasher = hashlib.sha256()
+    for mesh in meshes:
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        loops = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loops)
+        material_names = [material.name if material else None for material in mesh.materials]
+        hasher.update(json.dumps([mesh.name, material_names]).encode())
+        hasher.update(co.tobytes())
+        hasher.update(loops.tobytes())
+
+    for material in materials:
+        images = sorted(node.image.filepath for node in (material.node_tree.nodes if material.node_tree else [])
+                        if getattr(node, "image", None) is not None)
+        hasher.update(json.dumps([material.name, images]).encode())
+
+    return hasher.hexdigest()[:32]
+
+def link_shared_data(base_library: str, compress: bool = True) -> str:
+    '''
+    Moves the shared terrain and vegetation data of the scene to a base library .blend keyed by its content,
+    written once and reused by every scene with the same data, and links it back in place of the local data.
+    a scene saved afterwards only holds its own data plus the library links.
+
+    Args:
+        base_library (str): The directory of the base libraries.
+        compress (bool): Compress newly written base libraries.
+
+    Returns:
+        str: The path of the base library.
+    '''
+    meshes, materials = shared_datablocks()
+    if not meshes:
+        return None
+
+    os.makedirs(base_library, exist_ok=True)
+    library_path = os.path.join(base_library, f"shared_{shared_data_key(meshes, materials)}.blend")
+    if os.path.exists(library_path):
+        os.utime(library_path)
+    else:
+        atomic_write(library_path, lambda part_path: bpy.data.libraries.write(
+            part_path, set(meshes) | set(materials), path_remap='ABSOLUTE', fake_user=True, compress=compress))
+
+    with bpy.data.libraries.load(library_path, link=True) as (data_from, data_to):
+        data_to.meshes = [mesh.name for mesh in meshes]
+        data_to.materials = [material.name for material in materials]
+
+    for local, linked in zip(materials, data_to.materials):
+        local.user_remap(linked)
+        bpy.data.materials.remove(local)
+    for local, linked in zip(meshes, data_to.meshes):
+        local.user_remap(linked)
+        bpy.data.meshes.remove(local)
+
+    return library_path
+
+@contextmanager
+def unused_fake_users_cleared():
+    '''
+    Clears the fake users of datablocks nothing else uses, e.g. the terrain materials and tree templates
+    cached for later scenes, while in the with block. blender always saves datablocks with a fake user,
+    so without this every saved scene would hold everything cached earlier in the session.
+    '''
+    cleared = []
+    for datablocks in (bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images, bpy.data.node_groups):
+        for datablock in datablocks:
+            if datablock.use_fake_user and datablock.users == 1 and datablock.library is None:
+                datablock.use_fake_user = False
+                cleared.append(datablock)
+    try:
+        yield
+    finally:
+        for datablock in cleared:
+            datablock.use_fake_user = True
+
+def save_scene_to_file(file_name: str, compress: bool = False, relative_remap: bool = True,
+                       base_library: str = None) -> None:
     '''
     Saves the current scene to a file. \n
     !!! if the file exists, it will be overwritten !!!
+    datablocks kept for later scenes by a fake user are only saved when the scene uses them.
 
     Args:
         file_name (str): The name of the file to save the scene to.
+        compress (bool): Compress the file (zstd), smaller files for a little more save and open time.
+        relative_remap (bool): Store the paths of textures and libraries relative to the file.
+        base_library (str): Directory of base libraries, the shared terrain and vegetation data is saved there
+            once and linked from the scene, see link_shared_data. None saves all data in the file.
     '''
+    if base_library is not None:
+        link_shared_data(base_library, compress)
+
     remove_file(file_name)
-    bpy.ops.wm.save_as_mainfile(filepath=file_name)
+    with unused_fake_users_cleared():
+        bpy.ops.wm.save_as_mainfile(filepath=file_name, compress=compress, relative_remap=relative_remap)
 
 def clear() -> None:
     '''
@@ -30,6 +276,31 @@ def clear() -> None:
     bpy.ops.object.select_all(action='SELECT')
     bpy.ops.object.delete()
 
+def reset_scene(keep_fake_users: bool = False) -> None:
+    '''
+    Resets the session to an empty scene through bpy.data.
+    all objects and collections are removed, then every datablock without users
+    (meshes, materials, images, node groups, ...) is purged.
+
+    Args:
+        keep_fake_users (bool): Keep datablocks with a fake user, e.g. cached tree templates and
+            terrain materials, so the next scene can reuse them. otherwise they are purged too.
+    '''
+    for obj in list(bpy.data.objects):
+        if not (keep_fake_users and obj.use_fake_user):
+            bpy.data.objects.remove(obj, do_unlink=True)
+    for collection in list(bpy.data.collections):
+        bpy.data.collections.remove(collection)
+
+    if not keep_fake_users:
+        for datablocks in (bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images,
+                           bpy.data.textures, bpy.data.node_groups, bpy.data.curves, bpy.data.cameras,
+                           bpy.data.lights, bpy.data.actions, bpy.data.particles):
+            for datablock in datablocks:
+                datablock.use_fake_user = False
+
+    bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+
 def clear_except_to(object) -> None:
     '''
     Clears the scene by deleting all objects except the ones in the list.
@@ -41,17 +312,19 @@ def clear_except_to(object) -> None:
     object.select_set(True)
     bpy.ops.object.delete()
 
-def load_blend(filepath) -> bpy.types.Object:
+def load_blend(filepath, link: bool = False) -> bpy.types.Object:
     '''
     Load a specific object from a BLEND file.
 
     Args:
         filepath (str): The path to the BLEND file.
+        link (bool): Link the objects from the file as a library instead of appending copies,
+            saved scenes then reference the file instead of containing its data.
 
     Returns:
         bpy.types.Object: The object loaded from the BLEND file.
     '''
-    with bpy.data.libraries.load(filepath) as (data_from, data_to):
+    with bpy.data.libraries.load(filepath, link=link) as (data_from, data_to):
         data_to.objects = data_from.objects
 
     # Link objects to the current scene
@@ -1,70 +1,415 @@
 import os
 import bpy
-import random
-from ignite import add_fire_and_smoke
+import math
+import numpy as np
+from ignite import add_fire_and_smoke, add_fires
+from terrain import sample_heightmap, terrain_slope
+from culling import visible_mask
+from utils import atomic_write
 
 '''
 Basic Vegetation Generation: In the provided Blender project,
 implement initial tree models, Set up a basic random spawning system with a density control variable to adjust tree concentration.
 '''
 
-def load_vegetation():
+# imported models by file path, every tree is a linked duplicate of one of these
+_vegetation_templates: dict[str, bpy.types.Object] = {}
+
+# link tree models from .blend libraries next to the FBX files instead of importing them into the scene
+linked_models: bool = False
+
+def convert_model_to_blend(filepath: str, blend_path: str):
+    '''
+    Imports a model file once and writes it to a .blend library that scenes can link.
+    the object used as the template when importing the model is named after the model file,
+    so linking picks the same object, see get_vegetation_template.
+    the imported objects, their data and materials are removed again, the rest of the session is left alone.
+
+    Parameters:
+    filepath (str): The path to the model file.
+    blend_path (str): The path of the .blend library to write.
+
+    Returns:
+    None
+    '''
+    bpy.ops.import_scene.fbx(filepath=filepath)
+    imported = list(bpy.context.selected_objects)
+    imported[0].name = template_object_name(filepath)
+    datablocks = set(imported)
+    for obj in imported:
+        if obj.data is not None:
+            datablocks.add(obj.data)
+            datablocks.update(material for material in getattr(obj.data, "materials", []) if material is not None)
+
+    atomic_write(blend_path, lambda part_path: bpy.data.libraries.write(
+        part_path, datablocks, path_remap='ABSOLUTE', fake_user=True))
+
+    bpy.data.batch_remove(datablocks)
+
+def template_object_name(filepath: str) -> str:
+    '''
+    Returns the name of the template object of a model in its .blend library: the model file name without extension.
+    '''
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+def get_vegetation_template(filepath: str) -> bpy.types.Object:
+    '''
+    Returns the template object of a model, importing the file only the first time.
+    the template is kept out of the scene, trees are linked duplicates sharing its mesh and materials.
+    a .blend model is linked as a library, so its data is referenced by saved scenes instead of copied.
+
+    Parameters:
+    filepath (str): The path to the model file, .fbx or .blend.
+
+    Returns:
+    bpy.types.Object: The template object.
+    '''
+    template = _vegetation_templates.get(filepath)
+    if template is not None:
+        try:
+            template.name
+            return template
+        except ReferenceError:
+            # the template was removed from bpy.data, import the model again
+            del _vegetation_templates[filepath]
+
+    if filepath.endswith(".blend"):
+        name = template_object_name(filepath)
+        with bpy.data.libraries.load(filepath, link=True) as (data_from, data_to):
+            if name not in data_from.objects:
+                raise ValueError(f"{filepath} has no object {name}, delete it to convert the model again")
+            data_to.objects = [name]
+        template = data_to.objects[0]
+    else:
+        bpy.ops.import_scene.fbx(filepath=filepath)
+        template = bpy.context.selected_objects[0]
+        for collection in template.users_collection:
+            collection.objects.unlink(template)
+        template.use_fake_user = True
+    _vegetation_templates[filepath] = template
+
+    return template
+
+def choose_vegetation_model(rng: np.random.Generator = None) -> str:
     '''
-    Loads a tree model from a file and returns it.
+    Picks a random tree model and returns its file path.
+    with linked_models the path of its .blend library is returned, converting the model the first time.
+
+    Parameters:
+    rng (np.random.Generator): The random generator, None uses a new unseeded one.
+
+    Returns:
+    str: The path of the model.
     '''
+    rng = rng if rng is not None else np.random.default_rng()
     filenames = ["tree.fbx"]
-    filename = random.choice(filenames)
+    filename = filenames[rng.integers(len(filenames))]
     filepath = os.path.join(os.getcwd(), "models", filename)
-    bpy.ops.import_scene.fbx(filepath=filepath)
-    tree = bpy.context.selected_objects[0]
+    if not linked_models:
+        return filepath
+
+    blend_path = os.path.splitext(filepath)[0] + ".blend"
+    if not os.path.exists(blend_path):
+        convert_model_to_blend(filepath, blend_path)
+
+    return blend_path
+
+def load_vegetation(rng: np.random.Generator = None):
+    '''
+    Loads a tree model and returns a new tree object in the scene.
+
+    Parameters:
+    rng (np.random.Generator): The random generator picking the model, None uses a new unseeded one.
+    '''
+    return add_tree(get_vegetation_template(choose_vegetation_model(rng)))
+
+def add_tree(template: bpy.types.Object) -> bpy.types.Object:
+    '''
+    Returns a new tree object in the scene, a linked duplicate of a model template.
+
+    Parameters:
+    template (bpy.types.Object): The template object, see get_vegetation_template.
+    '''
+    tree = template.copy()
+    bpy.context.collection.objects.link(tree)
 
     return tree
 
-def put_on_mesh(obj, x, y):
+def put_on_mesh(obj, x, y, z=0.0):
     '''
-    Places the given object on height 0 at the specified coordinates.
+    Places the given object on the ground height z at the specified coordinates.
 
     Parameters:
     obj (bpy.types.Object): The object to place.
     x (float): The x-coordinate of the object's position.
     y (float): The y-coordinate of the object's position.
+    z (float): The ground height under the object.
 
     Returns:
     None
     '''
     height = obj.dimensions.z
-    obj.location = (x, y, height / 2)
+    obj.location = (x, y, z + height / 2)
+
+def sample_tree_positions(count: int, xpix: int, ypix: int, heightmap: np.ndarray = None,
+                          max_slope: float = None, rng: np.random.Generator = None) -> np.ndarray:
+    '''
+    Samples random ground positions for trees, all at once.
+    with a heightmap the positions cover the terrain and get its interpolated height,
+    points steeper than max_slope are rejected and drawn again.
+
+    Parameters:
+    count (int): The number of positions.
+    xpix (int): The width of the terrain.
+    ypix (int): The height of the terrain.
+    heightmap (np.ndarray): The terrain array, None places everything at height 0.
+    max_slope (float): The steepest allowed slope in degrees, None allows any slope.
+    rng (np.random.Generator): The random generator, None uses a new unseeded one.
+
+    Returns:
+    np.ndarray: (count, 3) array of positions.
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    if heightmap is None:
+        positions = np.zeros((count, 3))
+        positions[:, 0] = rng.uniform(0, xpix, count)
+        positions[:, 1] = rng.uniform(0, ypix, count)
+        return positions
+
+    rows, cols = heightmap.shape
+    slope = terrain_slope(heightmap) if max_slope is not None else None
+    accepted = []
+    remaining = count
+    for _ in range(100):
+        if remaining <= 0:
+            break
+        xs = rng.uniform(0, rows - 1, remaining)
+        ys = rng.uniform(0, cols - 1, remaining)
+        if slope is not None:
+            keep = sample_heightmap(slope, xs, ys) <= max_slope
+            xs, ys = xs[keep], ys[keep]
+        accepted.append(np.column_stack((xs, ys, sample_heightmap(heightmap, xs, ys))))
+        remaining -= len(xs)
 
-def generate_trees(count: int, xpix: int, ypix: int, terrain_mesh: bpy.types.Object):
+    if remaining > 0:
+        raise ValueError(f"could not place {count} trees on slopes below {max_slope} degrees")
+
+    return np.concatenate(accepted)
+
+def add_scatter_modifier(terrain_mesh: bpy.types.Object, template: bpy.types.Object,
+                         density: float, seed: int, max_slope: float = None) -> bpy.types.NodesModifier:
+    '''
+    Adds a geometry nodes modifier that scatters instances of a template over the terrain surface.
+
+    Parameters:
+    terrain_mesh (bpy.types.Object): The terrain mesh to scatter on.
+    template (bpy.types.Object): The object to instance.
+    density (float): Expected number of instances per unit of surface area.
+    seed (int): Seed of the point distribution.
+    max_slope (float): The steepest allowed slope in degrees, None allows any slope.
+
+    Returns:
+    bpy.types.NodesModifier: The scatter modifier.
+    '''
+    group = bpy.data.node_groups.new("TreeScatter", 'GeometryNodeTree')
+    group.interface.new_socket(name="Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    group.interface.new_socket(name="Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    nodes = group.nodes
+    links = group.links
+
+    group_input = nodes.new('NodeGroupInput')
+    group_output = nodes.new('NodeGroupOutput')
+
+    distribute = nodes.new('GeometryNodeDistributePointsOnFaces')
+    distribute.distribute_method = 'RANDOM'
+    distribute.inputs["Density"].default_value = density
+    distribute.inputs["Seed"].default_value = seed
+
+    if max_slope is not None:
+        # only faces whose normal is close enough to up get points
+        normal = nodes.new('GeometryNodeInputNormal')
+        separate = nodes.new('ShaderNodeSeparateXYZ')
+        flat_enough = nodes.new('FunctionNodeCompare')
+        flat_enough.data_type = 'FLOAT'
+        flat_enough.operation = 'GREATER_EQUAL'
+        flat_enough.inputs["B"].default_value = math.cos(math.radians(max_slope))
+        links.new(normal.outputs["Normal"], separate.inputs["Vector"])
+        links.new(separate.outputs["Z"], flat_enough.inputs["A"])
+        links.new(flat_enough.outputs["Result"], distribute.inputs["Selection"])
+
+    tree_info = nodes.new('GeometryNodeObjectInfo')
+    tree_info.transform_space = 'ORIGINAL'
+    tree_info.inputs["Object"].default_value = template
+    tree_info.inputs["As Instance"].default_value = True
+
+    # keep the template's import transform, and stand the trees on the surface like put_on_mesh
+    instance = nodes.new('GeometryNodeInstanceOnPoints')
+    instance.inputs["Rotation"].default_value = template.rotation_euler
+    instance.inputs["Scale"].default_value = template.scale
+    translate = nodes.new('GeometryNodeTranslateInstances')
+    translate.inputs["Translation"].default_value = (0, 0, template.dimensions.z / 2)
+    translate.inputs["Local Space"].default_value = False
+
+    join = nodes.new('GeometryNodeJoinGeometry')
+
+    links.new(group_input.outputs[0], distribute.inputs["Mesh"])
+    links.new(distribute.outputs["Points"], instance.inputs["Points"])
+    links.new(tree_info.outputs["Geometry"], instance.inputs["Instance"])
+    links.new(instance.outputs["Instances"], translate.inputs["Instances"])
+    links.new(group_input.outputs[0], join.inputs["Geometry"])
+    links.new(translate.outputs["Instances"], join.inputs["Geometry"])
+    links.new(join.outputs["Geometry"], group_output.inputs[0])
+
+    modifier = terrain_mesh.modifiers.new(name="TreeScatter", type='NODES')
+    modifier.node_group = group
+
+    return modifier
+
+def cull_tree_positions(positions: np.ndarray, dimensions: np.ndarray, camera: bpy.types.Object,
+                        frames: list[int]) -> np.ndarray:
+    '''
+    Tests which tree positions the animated camera sees at any of the given frames,
+    every tree is tested as the sphere around the bounding box of its tree model.
+
+    Parameters:
+    positions (np.ndarray): (N, 3) array of tree ground positions.
+    dimensions (np.ndarray): (N, 3) array of the dimensions of the tree models, or (3,) for one model.
+    camera (bpy.types.Object): The animated render camera, with the angle and scene resolution of the render.
+    frames (list[int]): The frames to sample the camera path at.
+
+    Returns:
+    np.ndarray: Boolean array of length N, True where the tree is seen.
+    '''
+    positions = np.asarray(positions, dtype=float)
+    dimensions = np.broadcast_to(np.asarray(dimensions, dtype=float), positions.shape)
+    centers = positions + np.column_stack((np.zeros((len(positions), 2)), dimensions[:, 2] / 2))
+    render = bpy.context.scene.render
+
+    return visible_mask(centers, camera, frames, (render.resolution_x, render.resolution_y),
+                        np.linalg.norm(dimensions, axis=1) / 2)
+
+def generate_trees(count: int, xpix: int, ypix: int, terrain_mesh: bpy.types.Object, mode: str = "objects",
+                   heightmap: np.ndarray = None, max_slope: float = None, cull: str = "none",
+                   camera: bpy.types.Object = None, frames: list[int] = None, rng: np.random.Generator = None):
     '''
     Generates trees on the terrain mesh at random positions.
+    in "objects" mode every tree is its own object, in "scatter" mode the trees are
+    instances of a single geometry nodes modifier on the terrain, with about count trees in total.
+    in "objects" mode trees the camera never sees can be hidden from render ("hide") or not created ("skip"),
+    which saves the scene sync and BVH build of the renderer.
 
     Parameters:
     count (int): The number of trees to generate.
     xpix (int): The width of the terrain mesh.
     ypix (int): The height of the terrain mesh.
     terrain_mesh (bpy.types.Object): The terrain mesh to place the trees on.
+    mode (str): "objects" or "scatter".
+    heightmap (np.ndarray): The terrain array of the mesh, used to put the trees on the ground.
+    max_slope (float): The steepest slope in degrees trees are placed on, None allows any slope.
+    cull (str): "none", "hide" or "skip", ignored in "scatter" mode.
+    camera (bpy.types.Object): The animated render camera, needed for culling.
+    frames (list[int]): The frames to sample the camera path at, by default every frame of the scene.
+    rng (np.random.Generator): The random generator of the trees, None uses a new unseeded one.
 
     Returns:
-    None
+    list[bpy.types.Object]: The tree objects, empty in "scatter" mode, without the skipped trees.
     '''
-    for _ in range(count):
-        x = random.uniform(0, xpix)
-        y = random.uniform(0, ypix)
+    rng = rng if rng is not None else np.random.default_rng()
+    if mode == "scatter":
+        template = get_vegetation_template(choose_vegetation_model(rng))
+        add_scatter_modifier(terrain_mesh, template, count / (xpix * ypix), int(rng.integers(0, 10**6)), max_slope)
+        return []
+
+    if mode != "objects":
+        raise ValueError(f"unknown tree generation mode {mode}")
+    if cull not in ("none", "hide", "skip"):
+        raise ValueError(f"unknown tree culling mode {cull}")
+
+    positions = sample_tree_positions(count, xpix, ypix, heightmap, max_slope, rng)
+    # the model of every tree is picked before culling, which tests every tree with its own model's size
+    templates = [get_vegetation_template(choose_vegetation_model(rng)) for _ in range(len(positions))]
+    visible = np.ones(len(positions), dtype=bool)
+    if cull != "none":
+        if frames is None:
+            scene = bpy.context.scene
+            frames = list(range(scene.frame_start, scene.frame_end + 1))
+        dimensions = np.array([tuple(template.dimensions) for template in templates])
+        visible = cull_tree_positions(positions, dimensions, camera, frames)
+        if cull == "skip":
+            positions, visible = positions[visible], visible[visible]
+            templates = [template for template, seen in zip(templates, visible) if seen]
 
-        tree = load_vegetation()
-        put_on_mesh(tree, x, y)
+    trees = []
+    for (x, y, z), seen, template in zip(positions, visible, templates):
+        tree = add_tree(template)
+        put_on_mesh(tree, x, y, z)
+        tree.hide_render = not seen
+        trees.append(tree)
 
-def add_burning_tree(position: tuple) -> bpy.types.Object:
+    return trees
+
+def place_tree(position: tuple, heightmap: np.ndarray = None, rng: np.random.Generator = None) -> bpy.types.Object:
+    '''
+    add a tree to the scene at the specified position, on the ground of the heightmap.
+
+    Parameters:
+    position (tuple): The position of the tree.
+    heightmap (np.ndarray): The terrain array, used to put the tree on the ground.
+    rng (np.random.Generator): The random generator picking the model, None uses a new unseeded one.
+
+    Returns:
+    bpy.types.Object: The tree object.
+    '''
+    x, y = position[0], position[1]
+    z = 0.0
+    if heightmap is not None:
+        z = float(sample_heightmap(heightmap, np.array([x]), np.array([y]))[0])
+
+    tree = load_vegetation(rng)
+    put_on_mesh(tree, x, y, z)
+
+    return tree
+
+def add_burning_tree(position: tuple, heightmap: np.ndarray = None,
+                     rng: np.random.Generator = None) -> bpy.types.Object:
     '''
     add a burning tree to the scene at the specified position.
 
     Parameters:
     position (tuple): The position of the burning tree.
+    heightmap (np.ndarray): The terrain array, used to put the tree on the ground.
+    rng (np.random.Generator): The random generator picking the model, None uses a new unseeded one.
 
     Returns:
     bpy.types.Object: The burning tree object.
     '''
-    tree = load_vegetation()
-    put_on_mesh(tree, position[0], position[1])
+    tree = place_tree(position, heightmap, rng)
     add_fire_and_smoke(tree)
+
+    return tree
+
+def add_burning_trees(positions: list[tuple], heightmap: np.ndarray = None, trees: list = (),
+                      fire_fraction: float = 0.0, cluster_radius: float = 20.0,
+                      rng: np.random.Generator = None) -> list[bpy.types.Object]:
+    '''
+    add burning trees at the specified positions and set a fraction of the existing trees on fire.
+    nearby fires share a simulation domain, see ignite.add_fires.
+
+    Parameters:
+    positions (list[tuple]): The positions of new burning trees.
+    heightmap (np.ndarray): The terrain array, used to put the new trees on the ground.
+    trees (list[bpy.types.Object]): The existing trees, e.g. from generate_trees.
+    fire_fraction (float): The fraction of the existing trees to set on fire.
+    cluster_radius (float): Fires within this distance of each other share a domain.
+    rng (np.random.Generator): The random generator of the fires, None uses a new unseeded one.
+
+    Returns:
+    list[bpy.types.Object]: The burning tree objects.
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    burning = [place_tree(position, heightmap, rng) for position in positions]
+    chosen = rng.choice(len(trees), round(fire_fraction * len(trees)), replace=False)
+    burning += [trees[index] for index in sorted(chosen)]
+    add_fires(burning, cluster_radius)
+
+    return burning
@@ -1,12 +1,141 @@
 import os
+import sys
 import bpy
+import glob
+import time
+import uuid
+import socket
 import random
 import math
+import argparse
+import multiprocessing
+from annotation import AnnotationRecorder, merge_annotations
+from ignite import unbaked_fire_domains
+from utils import atomic_write
 
-def get_video(file_path: str, camera: bpy.types.Object, path_duration: int, resolution: tuple[int, int], fov: float):
+# cycles quality presets, from fast previews to final quality renders
+render_profiles: dict[str, dict] = {
+    "draft": {
+        "samples": 16, "adaptive_threshold": 0.1, "adaptive_min_samples": 4,
+        "max_bounces": 2, "diffuse_bounces": 1, "glossy_bounces": 1, "transmission_bounces": 1,
+        "volume_bounces": 0, "transparent_max_bounces": 4, "volume_step_rate": 4.0,
+    },
+    "dataset": {
+        "samples": 64, "adaptive_threshold": 0.05, "adaptive_min_samples": 8,
+        "max_bounces": 4, "diffuse_bounces": 2, "glossy_bounces": 2, "transmission_bounces": 2,
+        "volume_bounces": 1, "transparent_max_bounces": 8, "volume_step_rate": 2.0,
+    },
+    "hero": {
+        "samples": 512, "adaptive_threshold": 0.01, "adaptive_min_samples": 32,
+        "max_bounces": 12, "diffuse_bounces": 4, "glossy_bounces": 4, "transmission_bounces": 12,
+        "volume_bounces": 2, "transparent_max_bounces": 8, "volume_step_rate": 1.0,
+    },
+}
+
+def gpu_available() -> bool:
+    '''
+    Enables the GPU devices cycles can render on, and returns whether there are any.
+    '''
+    preferences = bpy.context.preferences.addons["cycles"].preferences
+    for device_type in ('OPTIX', 'CUDA', 'HIP', 'METAL', 'ONEAPI'):
+        try:
+            preferences.compute_device_type = device_type
+        except TypeError:
+            # not supported by this build
+            continue
+        preferences.refresh_devices()
+        gpus = [device for device in preferences.devices if device.type != 'CPU']
+        for device in gpus:
+            device.use = True
+        if gpus:
+            return True
+
+    preferences.compute_device_type = 'NONE'
+    return False
+
+def apply_render_profile(profile: str, device: str = 'CPU', threads: int = 0):
+    '''
+    Configures cycles sampling, light bounces, denoising and threads from a named profile.
+    all profiles use adaptive sampling, OpenImageDenoise and persistent data, so scene data
+    is kept between the frames of an animation.
+
+    Parameters:
+    - profile: The name of the profile in render_profiles.
+    - device: The cycles device, 'CPU' or 'GPU'. 'GPU' falls back to the CPU with a warning when cycles finds no GPU.
+    - threads: The number of render threads, 0 uses all cores.
+
+    Returns:
+    - None
+    '''
+    if profile not in render_profiles:
+        raise ValueError(f"unknown render profile {profile}, expected one of {list(render_profiles)}")
+    settings = render_profiles[profile]
+
+    # cycles silently renders on the CPU when no GPU is set up, make the fallback visible
+    if device == 'GPU' and not gpu_available():
+        print("warning: no GPU render device available, rendering on the CPU", file=sys.stderr)
+        device = 'CPU'
+
+    scene = bpy.context.scene
+    scene.render.engine = 'CYCLES'
+    scene.cycles.device = device
+
+    scene.cycles.samples = settings["samples"]
+    scene.cycles.use_adaptive_sampling = True
+    scene.cycles.adaptive_threshold = settings["adaptive_threshold"]
+    scene.cycles.adaptive_min_samples = settings["adaptive_min_samples"]
+
+    scene.cycles.max_bounces = settings["max_bounces"]
+    scene.cycles.diffuse_bounces = settings["diffuse_bounces"]
+    scene.cycles.glossy_bounces = settings["glossy_bounces"]
+    scene.cycles.transmission_bounces = settings["transmission_bounces"]
+    scene.cycles.volume_bounces = settings["volume_bounces"]
+    scene.cycles.transparent_max_bounces = settings["transparent_max_bounces"]
+    scene.cycles.volume_step_rate = settings["volume_step_rate"]
+
+    scene.cycles.use_denoising = True
+    scene.cycles.denoiser = 'OPENIMAGEDENOISE'
+    scene.render.use_persistent_data = True
+
+    scene.render.threads_mode = 'FIXED' if threads else 'AUTO'
+    if threads:
+        scene.render.threads = threads
+
+def apply_raster_engine(engine: str, samples: int = 8):
+    '''
+    Configures a rasterizer for fast low resolution frames, 'EEVEE' or 'WORKBENCH'.
+    volumes are kept in both, so the fire and smoke of the fire domains stay visible.
+
+    Parameters:
+    - engine: 'EEVEE' or 'WORKBENCH'.
+    - samples: The number of anti-aliasing samples per frame in EEVEE.
+
+    Returns:
+    - None
+    '''
+    scene = bpy.context.scene
+    if engine == 'EEVEE':
+        scene.render.engine = 'BLENDER_EEVEE_NEXT'
+        scene.eevee.taa_render_samples = samples
+        scene.eevee.volumetric_tile_size = '4'
+        scene.eevee.volumetric_samples = 32
+        scene.eevee.volumetric_start = 0.1
+        scene.eevee.volumetric_end = scene.camera.data.clip_end
+    elif engine == 'WORKBENCH':
+        scene.render.engine = 'BLENDER_WORKBENCH'
+        scene.display.render_aa = '5'
+        scene.display.shading.light = 'STUDIO'
+        scene.display.shading.color_type = 'TEXTURE'
+    else:
+        raise ValueError(f"unknown raster engine {engine}, expected 'EEVEE' or 'WORKBENCH'")
+
+def get_video(file_path: str, camera: bpy.types.Object, path_duration: int, resolution: tuple[int, int], fov: float,
+              profile: str = "dataset", device: str = 'CPU', threads: int = 0, engine: str = 'CYCLES',
+              annotations_path: str = None, masks_dir: str = None):
     '''
     Renders a video using the specified camera and path duration.
-    Uses GPU acceleration with cycles rendering for optimal performance.
+    Uses cycles rendering with the settings of a render profile, or a rasterizer for bulk frames.
+    Optionally records the fire bounding boxes of every frame, and object index masks, while rendering.
 
     Parameters:
     - file_path: The path where the rendered video will be saved.
@@ -14,31 +143,433 @@ def get_video(file_path: str, camera: bpy.types.Object, path_duration: int, reso
     - path_duration: The duration of the video in frames.
     - resolution: The resolution of the video in pixels.
     - fov: The field of view of the camera in degrees.
+    - profile: The name of the render profile in render_profiles.
+    - device: The cycles device, 'CPU' or 'GPU'.
+    - threads: The number of render threads, 0 uses all cores.
+    - engine: 'CYCLES', 'EEVEE' or 'WORKBENCH'.
+    - annotations_path: The .npz file to save the frame annotations to, None records no annotations.
+    - masks_dir: The directory to write object index masks to, None writes no masks.
 
     Returns:
     - None
     '''
-    bpy.context.scene.camera = camera
-    bpy.context.scene.frame_end = path_duration
+    setup_render(camera, path_duration, resolution, fov, profile, device, threads, engine)
     bpy.context.scene.render.image_settings.file_format = 'FFMPEG'
     bpy.context.scene.render.ffmpeg.format = 'MPEG4'
     bpy.context.scene.render.filepath = file_path
 
-    bpy.context.scene.render.engine = 'CYCLES'
-    bpy.context.scene.cycles.device = 'GPU'
+    if annotations_path is None:
+        bpy.ops.render.render(animation=True)
+        return
+
+    recorder = AnnotationRecorder(bpy.context.scene, masks_dir)
+    recorder.start()
+    try:
+        bpy.ops.render.render(animation=True)
+    finally:
+        recorder.stop()
+    recorder.save(annotations_path)
+
+def setup_render(camera: bpy.types.Object, path_duration: int, resolution: tuple[int, int], fov: float,
+                 profile: str = "dataset", device: str = 'CPU', threads: int = 0, engine: str = 'CYCLES'):
+    '''
+    Sets the camera, frame range, render settings and resolution of the scene.
+
+    Parameters:
+    - camera: The camera object used for rendering.
+    - path_duration: The duration of the video in frames.
+    - resolution: The resolution of the video in pixels.
+    - fov: The field of view of the camera in degrees.
+    - profile: The name of the render profile in render_profiles.
+    - device: The cycles device, 'CPU' or 'GPU'.
+    - threads: The number of render threads, 0 uses all cores.
+    - engine: 'CYCLES', 'EEVEE' or 'WORKBENCH', the profile, device and threads only apply to cycles.
+
+    Returns:
+    - None
+    '''
+    bpy.context.scene.camera = camera
+    bpy.context.scene.frame_start = 1
+    bpy.context.scene.frame_end = path_duration
+
+    if engine == 'CYCLES':
+        apply_render_profile(profile, device, threads)
+    else:
+        apply_raster_engine(engine)
 
     bpy.context.scene.render.resolution_x = resolution[0]
     bpy.context.scene.render.resolution_y = resolution[1]
     bpy.context.scene.camera.data.angle = math.radians(fov)
 
-    bpy.ops.render.render(animation=True)
+def frame_path(frames_dir: str, frame: int) -> str:
+    '''
+    Returns the image path of a frame in a frame sequence directory.
+    '''
+    return os.path.join(frames_dir, f"frame_{frame:05d}.png")
+
+def lock_owner() -> str:
+    '''
+    Returns the owner written into the frame locks of this process: the host name and the process id.
+    '''
+    return f"{socket.gethostname()} {os.getpid()}"
+
+def lock_abandoned(lock_path: str, owner: str, stale_seconds: float) -> bool:
+    '''
+    Decides whether a frame lock was left by a crashed render: its owner process on this host is dead,
+    or it is older than stale_seconds and owned by another host, whose processes can't be checked.
+
+    Parameters:
+    - lock_path: The lock file.
+    - owner: The owner written in the lock, see lock_owner.
+    - stale_seconds: The age after which a lock of another host is considered abandoned.
+
+    Returns:
+    - True if the lock can be taken over.
+    '''
+    host, _, pid = owner.partition(" ")
+    if host == socket.gethostname() and pid.isdigit():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    return time.time() - os.path.getmtime(lock_path) >= stale_seconds
+
+def create_lock(lock_path: str) -> bool:
+    '''
+    Creates a frame lock owned by this process, if no lock exists.
+
+    Parameters:
+    - lock_path: The lock file.
+
+    Returns:
+    - True if the lock was created.
+    '''
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as lock_file:
+        lock_file.write(lock_owner())
+
+    return True
+
+def claim_frame(frames_dir: str, frame: int, stale_seconds: float) -> bool:
+    '''
+    Claims a frame for rendering with a lock file holding the host and process id of its owner, so processes
+    and machines sharing frames_dir never render the same frame twice. locks of dead processes on this host,
+    and locks of other hosts older than stale_seconds, are left by crashed renders and are taken over.
+
+    Parameters:
+    - frames_dir: The frame sequence directory.
+    - frame: The frame to claim.
+    - stale_seconds: The age after which a lock of another host is considered abandoned.
+
+    Returns:
+    - True if the frame was claimed, False if it is done or claimed by another process.
+    '''
+    path = frame_path(frames_dir, frame)
+    if os.path.exists(path):
+        return False
+
+    lock_path = path + ".lock"
+    if create_lock(lock_path):
+        return True
+
+    try:
+        with open(lock_path) as lock_file:
+            owner = lock_file.read()
+        if not lock_abandoned(lock_path, owner, stale_seconds):
+            return False
+
+        # move the abandoned lock aside, the rename succeeds for only one of the processes taking it over
+        abandoned_path = f"{lock_path}.{lock_owner().replace(' ', '.')}.abandoned"
+        os.rename(lock_path, abandoned_path)
+    except FileNotFoundError:
+        # finished or taken over by another process meanwhile
+        return create_lock(lock_path)
+
+    with open(abandoned_path) as lock_file:
+        moved = lock_file.read()
+    if moved != owner:
+        # a fresh lock replaced the abandoned one before the rename, put it back
+        try:
+            os.link(abandoned_path, lock_path)
+        except FileExistsError:
+            pass
+        os.remove(abandoned_path)
+        return False
+
+    os.remove(abandoned_path)
+    return create_lock(lock_path)
+
+def render_still(path: str):
+    '''
+    Renders the current frame of the scene to an image file.
+
+    Parameters:
+    - path: The image file, the render file extension is not appended.
+
+    Returns:
+    - None
+    '''
+    bpy.context.scene.render.filepath = path
+    bpy.ops.render.render(write_still=True)
+
+def render_frames(frames_dir: str, frames: list[int], stale_seconds: float = 3600) -> list[int]:
+    '''
+    Renders frames of the current scene to PNG images, skipping frames already on disk or claimed by others.
+    every image is written with utils.atomic_write, so an interrupted render never leaves a broken frame behind.
+
+    Parameters:
+    - frames_dir: The frame sequence directory.
+    - frames: The frames to render, in order.
+    - stale_seconds: The age after which a frame lock of another host is considered abandoned.
+
+    Returns:
+    - The frames rendered by this call.
+    '''
+    os.makedirs(frames_dir, exist_ok=True)
+    scene = bpy.context.scene
+    scene.render.image_settings.file_format = 'PNG'
+    scene.render.use_file_extension = False
+
+    rendered = []
+    for frame in frames:
+        if not claim_frame(frames_dir, frame, stale_seconds):
+            continue
+
+        path = frame_path(frames_dir, frame)
+        try:
+            scene.frame_set(frame)
+            atomic_write(path, render_still)
+        finally:
+            os.remove(path + ".lock")
+        rendered.append(frame)
+
+    return rendered
+
+def chunk_order(path_duration: int, chunk_size: int, worker: int, workers: int) -> list[int]:
+    '''
+    Orders the frames of the animation for one worker: the frames are split into chunks,
+    and every worker starts on its own chunk and then walks the other chunks, so workers
+    render contiguous ranges and pick up the leftovers of slower or crashed workers.
+
+    Parameters:
+    - path_duration: The duration of the video in frames.
+    - chunk_size: The number of frames in a chunk.
+    - worker: The index of this worker.
+    - workers: The number of workers.
+
+    Returns:
+    - All frames in the order this worker should try them.
+    '''
+    chunks = [list(range(start, min(start + chunk_size, path_duration + 1)))
+              for start in range(1, path_duration + 1, chunk_size)]
+    first = (worker * len(chunks)) // max(workers, 1)
+    chunks = chunks[first:] + chunks[:first]
+
+    return [frame for chunk in chunks for frame in chunk]
+
+def render_chunk_worker(job: tuple) -> list[int]:
+    '''
+    Opens a scene and renders its share of the frames, runs in a worker process.
+
+    Parameters:
+    - job: scene path, frames directory, camera name, path duration, resolution, fov, render profile,
+      device, threads, engine, chunk size, worker index, worker count, whether to record annotations,
+      whether to write masks and the age after which a frame lock of another host is abandoned.
+
+    Returns:
+    - The frames rendered by this worker.
+    '''
+    (scene_path, frames_dir, camera_name, path_duration, resolution, fov,
+     profile, device, threads, engine, chunk_size, worker, workers, annotate, masks, stale_seconds) = job
+
+    bpy.ops.wm.open_mainfile(filepath=scene_path)
+    setup_render(bpy.data.objects[camera_name], path_duration, resolution, fov, profile, device, threads, engine)
+    frames = chunk_order(path_duration, chunk_size, worker, workers)
+    if not annotate:
+        return render_frames(frames_dir, frames, stale_seconds)
+
+    # every process keeps its own annotation file, they are merged when the video is encoded
+    recorder = AnnotationRecorder(bpy.context.scene, os.path.join(frames_dir, "masks") if masks else None)
+    recorder.start()
+    try:
+        rendered = render_frames(frames_dir, frames, stale_seconds)
+    finally:
+        recorder.stop()
+    if rendered:
+        recorder.save(os.path.join(frames_dir, f"annotations_{uuid.uuid4().hex}.npz"))
+
+    return rendered
+
+def encode_video(frames_dir: str, file_path: str, path_duration: int, resolution: tuple[int, int]):
+    '''
+    Encodes a rendered frame sequence to an MPEG4 video with the sequence editor of a separate scene.
+
+    Parameters:
+    - frames_dir: The frame sequence directory.
+    - file_path: The path where the video will be saved.
+    - path_duration: The duration of the video in frames.
+    - resolution: The resolution of the video in pixels.
+
+    Returns:
+    - None
+    '''
+    missing = [frame for frame in range(1, path_duration + 1) if not os.path.exists(frame_path(frames_dir, frame))]
+    if missing:
+        raise RuntimeError(f"{len(missing)} frames are not rendered yet, first missing frame is {missing[0]}")
+
+    scene = bpy.data.scenes.new("encode")
+    scene.sequence_editor_create()
+    strip = scene.sequence_editor.sequences.new_image(name="frames", filepath=frame_path(frames_dir, 1),
+                                                      channel=1, frame_start=1)
+    for frame in range(2, path_duration + 1):
+        strip.elements.append(os.path.basename(frame_path(frames_dir, frame)))
+
+    scene.frame_start = 1
+    scene.frame_end = path_duration
+    scene.render.resolution_x = resolution[0]
+    scene.render.resolution_y = resolution[1]
+    scene.render.resolution_percentage = 100
+    scene.render.use_sequencer = True
+    scene.render.image_settings.file_format = 'FFMPEG'
+    scene.render.ffmpeg.format = 'MPEG4'
+    scene.render.filepath = file_path
+
+    bpy.ops.render.render(animation=True, scene=scene.name)
+    bpy.data.scenes.remove(scene)
+
+def get_video_chunked(scene_path: str, file_path: str, frames_dir: str, camera_name: str, path_duration: int,
+                      resolution: tuple[int, int], fov: float, workers: int, chunk_size: int, encode: bool = True,
+                      profile: str = "dataset", device: str = 'CPU', threads: int = 0, engine: str = 'CYCLES',
+                      annotations_path: str = None, masks: bool = False, stale_seconds: float = 3600):
+    '''
+    Renders a scene's camera path as an image sequence with several local processes, then encodes the video.
+    frames already in frames_dir are kept, so an interrupted render resumes where it stopped, and
+    other machines sharing frames_dir can run this with encode=False to render part of the frames.
+    with annotations every process records the annotations of its frames in frames_dir, and they
+    are merged into annotations_path with the encoding.
+    every worker jumps straight to its frames, so the fire domains of the scene have to be baked,
+    see forrestGeneration.py --bake-fire, or a RuntimeError is raised before any frame renders.
+
+    Parameters:
+    - scene_path: The path of the scene to render.
+    - file_path: The path where the rendered video will be saved.
+    - frames_dir: The frame sequence directory.
+    - camera_name: The name of the camera object used for rendering.
+    - path_duration: The duration of the video in frames.
+    - resolution: The resolution of the video in pixels.
+    - fov: The field of view of the camera in degrees.
+    - workers: The number of render processes.
+    - chunk_size: The number of consecutive frames a worker renders before moving on.
+    - encode: Whether to encode the video when the frames are done.
+    - profile: The name of the render profile in render_profiles.
+    - device: The cycles device, 'CPU' or 'GPU'.
+    - threads: The number of render threads per worker, 0 uses all cores.
+    - engine: 'CYCLES', 'EEVEE' or 'WORKBENCH'.
+    - annotations_path: The .npz file to save the frame annotations to, None records no annotations.
+    - masks: Whether to write object index masks to frames_dir/masks.
+    - stale_seconds: The age after which a frame lock of another host is considered abandoned,
+      locks of dead processes on this host are taken over right away.
+
+    Returns:
+    - None
+    '''
+    bpy.ops.wm.open_mainfile(filepath=scene_path)
+    unbaked = unbaked_fire_domains(bpy.context.scene)
+    if unbaked:
+        raise RuntimeError(f"fire domains {unbaked} of {scene_path} are not baked, chunked rendering needs "
+                           f"baked fire, save the scene with forrestGeneration.py --bake-fire")
+
+    jobs = [(scene_path, frames_dir, camera_name, path_duration, resolution, fov,
+             profile, device, threads, engine, chunk_size, worker, workers, annotations_path is not None, masks,
+             stale_seconds)
+            for worker in range(workers)]
+
+    # spawn so every worker gets its own clean bpy
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers) as pool:
+        rendered = sum(pool.map(render_chunk_worker, jobs), [])
+    print(f"rendered {len(rendered)} frames to {frames_dir}")
+
+    if encode:
+        encode_video(frames_dir, file_path, path_duration, resolution)
+        if annotations_path is not None:
+            merge_annotations(sorted(glob.glob(os.path.join(frames_dir, "annotations_*.npz"))), annotations_path)
+
+def benchmark_engines(camera: bpy.types.Object, frames: int, resolution: tuple[int, int], fov: float,
+                      engines: list[str], profile: str = "dataset", device: str = 'CPU') -> dict[str, float]:
+    '''
+    Measures the frames per second of render engines on the current scene, without writing images.
+
+    Parameters:
+    - camera: The camera object used for rendering.
+    - frames: The number of frames to render with every engine, starting at frame 1.
+    - resolution: The resolution of the frames in pixels.
+    - fov: The field of view of the camera in degrees.
+    - engines: The engines to compare, 'CYCLES', 'EEVEE' or 'WORKBENCH'.
+    - profile: The cycles render profile.
+    - device: The cycles device.
+
+    Returns:
+    - The frames per second of every engine.
+    '''
+    fps = {}
+    for engine in engines:
+        setup_render(camera, frames, resolution, fov, profile, device, engine=engine)
+
+        # the first frame includes scene sync and shader compilation, time it separately
+        bpy.context.scene.frame_set(1)
+        bpy.ops.render.render()
+        start = time.perf_counter()
+        for frame in range(2, frames + 1):
+            bpy.context.scene.frame_set(frame)
+            bpy.ops.render.render()
+        fps[engine] = (frames - 1) / (time.perf_counter() - start)
+        print(f"{engine}: {fps[engine]:.2f} frames per second")
+
+    return fps
 
 def clear():
     bpy.ops.object.select_all(action='SELECT')
     bpy.ops.object.delete()
 
 if __name__ == "__main__":
-    # Configuration values directly hard-coded instead of using argparser
+    parser = argparse.ArgumentParser(description="Render the camera path of a scene to a video.")
+    parser.add_argument("--mode", type=str, default="single", choices=["single", "chunked"],
+                        help="Render in this process, or as image sequence chunks in parallel processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of render processes in chunked mode")
+    parser.add_argument("--chunk-size", type=int, default=10,
+                        help="Number of consecutive frames a worker renders in chunked mode")
+    parser.add_argument("--frames-dir", type=str, default=os.path.join("videos", "frames"),
+                        help="Frame sequence directory in chunked mode, may be shared between machines")
+    parser.add_argument("--stale-seconds", type=float, default=3600,
+                        help="Age after which a frame lock of another machine is taken over in chunked mode")
+    parser.add_argument("--no-encode", action="store_true",
+                        help="Only render frames in chunked mode, leave encoding to another run")
+    parser.add_argument("--engine", type=str, default="CYCLES", choices=["CYCLES", "EEVEE", "WORKBENCH"],
+                        help="Render engine, the rasterizers are much faster for bulk dataset frames")
+    parser.add_argument("--benchmark-engines", type=int, default=0,
+                        help="Instead of rendering the video, compare the frames per second of all engines over this many frames")
+    parser.add_argument("--profile", type=str, default="dataset", choices=list(render_profiles),
+                        help="Cycles render profile")
+    parser.add_argument("--device", type=str, default="CPU", choices=["CPU", "GPU"],
+                        help="Cycles render device")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Render threads per process, 0 uses all cores")
+    parser.add_argument("--annotate", action="store_true",
+                        help="Record the fire bounding boxes of every frame while rendering, saved next to the video")
+    parser.add_argument("--masks", action="store_true",
+                        help="Also write object index masks of the annotated objects with --annotate")
+    args = parser.parse_args()
+
+    # Scene configuration values are hard-coded
     scene_path = os.path.join("terrains", "terrain.blend")
     output_video_path = os.path.join("videos", "terrain.mp4")
     camera_location = (50, 50, 100)
@@ -55,9 +586,24 @@ if __name__ == "__main__":
     base_path = '/Users/ilay_menachem/Documents/technion.nosync/2025/blender_scripts'
     video_path = os.path.join(base_path, output_video_path)
     scence_path = os.path.join(base_path, scene_path)
+    annotations_path = os.path.splitext(video_path)[0] + "_annotations.npz" if args.annotate else None
+    masks = args.annotate and args.masks
 
-    clear()
-    bpy.ops.wm.open_mainfile(filepath=scence_path)
+    if args.mode == "chunked":
+        frames_path = os.path.join(base_path, args.frames_dir)
+        get_video_chunked(scence_path, video_path, frames_path, 'camera', path_duration, render_resolution,
+                          render_fov, args.workers, args.chunk_size, not args.no_encode,
+                          args.profile, args.device, args.threads, args.engine, annotations_path, masks,
+                          args.stale_seconds)
+    else:
+        clear()
+        bpy.ops.wm.open_mainfile(filepath=scence_path)
 
-    camera = bpy.data.objects['camera']
-    get_video(video_path, camera, path_duration, render_resolution, render_fov)
+        camera = bpy.data.objects['camera']
+        if args.benchmark_engines:
+            benchmark_engines(camera, args.benchmark_engines, render_resolution, render_fov,
+                              ["CYCLES", "EEVEE", "WORKBENCH"], args.profile, args.device)
+        else:
+            masks_dir = os.path.join(base_path, "videos", "masks") if masks else None
+            get_video(video_path, camera, path_duration, render_resolution, render_fov,
+                      args.profile, args.device, args.threads, args.engine, annotations_path, masks_dir)
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import traceback
+import contextlib
+
+import bpy
+from utils import reset_scene
+
+'''
+Long lived Blender worker: reads scene and render jobs as JSON lines from stdin and answers
+every job with one JSON line on stdout, so bpy is imported once for many jobs.
+
+scene job:  {"id": "a", "type": "scene", "params": {"seed": 3, "output_path": "terrains/a.blend"}}
+render job: {"id": "b", "type": "render", "scene_path": "terrains/a.blend", "output_path": "videos/a.mp4",
+             "annotations_path": "videos/a_annotations.npz"}
+'''
+
+def run_scene_job(job: dict):
+    '''
+    Builds and saves a scene, params override the forrestGeneration.py defaults.
+
+    Parameters:
+    - job: The scene job.
+
+    Returns:
+    - None
+    '''
+    from forrestGeneration import parse_scene_params, generate_scene
+
+    generate_scene(parse_scene_params(job.get("params", {})))
+
+def run_render_job(job: dict):
+    '''
+    Opens a saved scene and renders its camera path to a video.
+
+    Parameters:
+    - job: The render job.
+
+    Returns:
+    - None
+    '''
+    from videoGeneration import get_video
+
+    bpy.ops.wm.open_mainfile(filepath=os.path.join(os.getcwd(), job["scene_path"]))
+    camera = bpy.data.objects[job.get("camera", "camera")]
+    get_video(os.path.join(os.getcwd(), job["output_path"]), camera, job.get("path_duration", 200),
+              tuple(job.get("resolution", (144, 144))), job.get("fov", 30.0),
+              job.get("profile", "dataset"), job.get("device", 'CPU'), job.get("threads", 0),
+              job.get("engine", 'CYCLES'), job.get("annotations_path"), job.get("masks_dir"))
+
+job_runners = {
+    "scene": run_scene_job,
+    "render": run_render_job,
+}
+
+def run_job(line: str) -> dict:
+    '''
+    Parses a job line, resets the session and runs the job, everything the job prints goes to stderr.
+    a malformed line, a failed reset or a failed job are answered with an error report.
+
+    Parameters:
+    - line: The JSON line of the job, its "type" selects the runner.
+
+    Returns:
+    - The job report with the status and the reset and run times in seconds.
+    '''
+    report = {"id": None, "type": None}
+
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            job = json.loads(line)
+            report.update({"id": job.get("id"), "type": job.get("type")})
+
+            start = time.perf_counter()
+            reset_scene(keep_fake_users=True)
+            report["reset_seconds"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            try:
+                job_runners[job["type"]](job)
+            finally:
+                report["job_seconds"] = time.perf_counter() - start
+            report["status"] = "ok"
+        except Exception:
+            report["status"] = "error"
+            report["error"] = traceback.format_exc()
+
+    return report
+
+if __name__ == "__main__":
+    # blender prints to the stdout file descriptor directly, send it to stderr and keep stdout for the reports
+    reports = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        report = run_job(line)
+        reports.write(json.dumps(report) + "\n")
+        reports.flush()